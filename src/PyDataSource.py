@@ -314,6 +314,51 @@ def _repr_value(value):
                 except:
                     return value
 
+def _projection_map(coords, masks, bins):
+    """
+    Precompute the pixel to bin map for polar (radial or azimuthal) projections.
+
+    Per event the projection is then a single np.bincount of the mapped pixels
+    instead of masking the image and histogramming the pixel coordinates.
+
+    Parameters
+    ----------
+    coords : array
+        Pixel coordinates with the same shape as the data
+    masks : list of arrays
+        Mask of pixels to ignore (True = ignore), one for each output ring.
+    bins : array
+        Bin edges (last bin includes the right edge as in np.histogram)
+
+    Returns
+    -------
+    dict with the flat 'pixel_index' and 'bin_index' of the pixels included 
+    (bin_index offset by the ring number times the number of bins) 
+    and 'norm' -- the number of pixels in each bin with shape 
+    (nbins) for one mask and (nrings, nbins) for a list of masks.
+    """
+    import numpy as np
+    bins = np.asarray(bins, dtype=float)
+    nbins = bins.size-1
+    coords = np.asarray(coords, dtype=float).ravel()
+    in_range = (coords >= bins[0]) & (coords <= bins[-1])
+    pixel_index = []
+    bin_index = []
+    for iring, mask in enumerate(masks):
+        ipixels = np.flatnonzero(in_range & ~np.asarray(mask, dtype=bool).ravel())
+        ibins = np.searchsorted(bins, coords[ipixels], side='right')-1
+        ibins[ibins == nbins] = nbins-1
+        pixel_index.append(ipixels)
+        bin_index.append(ibins+iring*nbins)
+
+    pixel_index = np.concatenate(pixel_index)
+    bin_index = np.concatenate(bin_index)
+    norm = np.bincount(bin_index, minlength=len(masks)*nbins)
+    if len(masks) > 1:
+        norm = norm.reshape(len(masks), nbins)
+    
+    return {'pixel_index': pixel_index, 'bin_index': bin_index, 'norm': norm}
+
 def _is_psana_type(value):
     """True if the input is a psana data type
     """
@@ -547,11 +592,11 @@ class ScanData(object):
             while not okevt:
                 evt = step.next()
                 ttup = (evt.EventId.sec, evt.EventId.nsec, evt.EventId.fiducials)
-                okevt = ttup in ds._idx_times_tuple
+                okevt = ttup in ds._idx_times_lookup
                 if not quiet:
                     print('step:', istep, evt)
 
-            ievent = ds._idx_times_tuple.index(ttup)
+            ievent = ds._idx_times_lookup[ttup]
             ievent_start.append(ievent)
             if istep > 0:
                 ievent_end.append(ievent-1)
@@ -1215,8 +1260,9 @@ class DataSource(object):
                 self.nevents = len(self._idx_times)
                 self._idx_times_tuple = [(a.seconds(), a.nanoseconds(), a.fiducial()) \
                                         for a in self._idx_times]
-                self._idx_datetime64 = [np.datetime64(int(sec*1e9+nsec), 'ns') \
-                                        for sec,nsec,fid in self._idx_times_tuple]
+                self._idx_datetime64 = get_datetime64([a[0] for a in self._idx_times_tuple],
+                                        [a[1] for a in self._idx_times_tuple])
+                self._idx_times_lookup = {ttup: i for i, ttup in enumerate(self._idx_times_tuple)}
 
             if 'BldInfo(EBeam)' not in self.configData._sources:
                 try:
@@ -1275,8 +1321,9 @@ class DataSource(object):
                     self.nevents = len(self._idx_times)
                     self._idx_times_tuple = [(a.seconds(), a.nanoseconds(), a.fiducial()) \
                                             for a in self._idx_times]
-                    self._idx_datetime64 = [np.datetime64(int(sec*1e9+nsec), 'ns') \
-                                            for sec,nsec,fid in self._idx_times_tuple]
+                    self._idx_datetime64 = get_datetime64([a[0] for a in self._idx_times_tuple],
+                                            [a[1] for a in self._idx_times_tuple])
+                    self._idx_times_lookup = {ttup: i for i, ttup in enumerate(self._idx_times_tuple)}
 
         else:
             # For live data or data_source without idx or smd
@@ -1288,6 +1335,22 @@ class DataSource(object):
 
         return str(self.data_source)
 
+    def _get_event_index(self, evt_time):
+        """Event number in the run for a psana.EventTime or a
+           (seconds, nanoseconds, fiducial) time tuple.
+           
+           Uses the hashed time index built in load_run.
+           Raises ValueError if the time is not in the run.
+        """
+        if evt_time.__class__.__name__ == 'EventTime':
+            evt_time = (evt_time.seconds(), evt_time.nanoseconds(), evt_time.fiducial())
+        if not hasattr(self, '_idx_times_lookup'):
+            self._idx_times_lookup = {ttup: i for i, ttup in enumerate(self._idx_times_tuple)}
+        try:
+            return self._idx_times_lookup[tuple(evt_time)]
+        except KeyError:
+            raise ValueError('{:} is not in run'.format(evt_time))
+
     def reload(self, reset_stats=True):
         """Reload the current run.
         """
@@ -1683,6 +1746,7 @@ class DataSource(object):
         Initialize evr. 
         Requires first event to know which evr when more than one present.
         """
+        self._evr_src = None
         try:
             while 'EvrData' not in self._evt_modules and self._ievent < 400:
                 evt = self.events.next()
@@ -1697,6 +1761,7 @@ class DataSource(object):
             devName = srcname.split(':')[1].split('.')[0]
             ievr = srcname.split(':')[1].split('.')[1]
             self._evr = psana.Detector(srcstr)
+            self._evr_src = srcstr
             #self._evr = psana.Detector('evr{:}'.format(ievr))
             self._evr_alias = 'evr{:}'.format(ievr)
         else:
@@ -2063,7 +2128,10 @@ class DataSource(object):
                         for name, stat_item in stats_config.items():
                             attr = stat_item['attr']
                             print('adding stats for', attr, name, )
-                            detector.add.stats(attr, name=name)
+                            detector.add.stats(attr, name=name, 
+                                    block_size=stat_item.get('block_size', 1),
+                                    dtype=stat_item.get('dtype'),
+                                    minmax=stat_item.get('minmax', True))
                         self.reload()
         self.reload()
 
@@ -2266,7 +2334,7 @@ class RunEvents(object):
                 if isinstance(evt_time, int):
                     self._ds._ievent = evt_time
                 else:
-                    self._ds._ievent = self.times.index(evt_time)
+                    self._ds._ievent = self._ds._get_event_index(evt_time)
             else:
                 self._ds._ievent += 1
             
@@ -2330,7 +2398,7 @@ class SmdEvents(object):
         except:
             try:
                 self._ds.steps.next()
-                return self._ds._current_step.next(**kwargs)
+                return self._ds._current_step.next(evt_time=evt_time, **kwargs)
             except:
                 raise StopIteration()
 
@@ -2430,11 +2498,10 @@ class StepEvents(object):
 
                 if evt_time.__class__.__name__ == 'EventTime':
                     # lookup event index from time tuple
-                    ttup = (evt_time.seconds(), evt_time.nanoseconds(), evt_time.fiducial())
-                    self._ds._ievent = self._ds._idx_times_tuple.index(ttup)
+                    self._ds._ievent = self._ds._get_event_index(evt_time)
                 elif isinstance(evt_time, tuple):
                     # optionally accept a time tuple (seconds, nanoseconds, fiducial)
-                    self._ds._ievent = self._ds._idx_times_tuple.index(evt_time)
+                    self._ds._ievent = self._ds._get_event_index(evt_time)
                     evt_time = self._ds._idx_times[self._ds._ievent]
                 else:
                     # if an integer was passed jump to the appropriate time from 
@@ -3343,7 +3410,10 @@ class EvtDetectors(object):
         EvrData object
         """
         if 'EvrData' in self._ds._evt_modules:
-            return EvrData(self._ds)
+            key = ('EvrData', 'evr')
+            if key not in self._ds._current_data:
+                self._ds._current_data[key] = EvrData(self._ds)
+            return self._ds._current_data[key]
         else:
             return EvrNullData(self._ds)
 
@@ -3731,29 +3801,64 @@ class EvrData(object):
     ds : DataSource object
 
     """
-    _detail_attrs  = ['present', 'timestampHigh', 'timestampLow',
-                      '_attr_info', '_src', '_typ', '_info', '_typ_func',
-                      'show_info', 'show_table', '_present', '_values', '_all_values']
+    _detail_attrs  = ['_attr_info', '_src', '_typ', '_info', '_typ_func',
+                      'show_info', 'show_table', '_values', '_all_values']
 
     def __init__(self, ds):
         self._ds = ds
         self._evr = None
     
+    @property
+    def _codes(self):
+        """
+        EvrEventCodes decoded once for the current event.
+        """
+        return _get_evr_codes(self._ds)
+
     @property
     def eventCodes_strict(self):
         """
         eventcodes that were sent on precisely the fiducial corresponding to the evt.
         """
-        attr = 'eventCodes'
-        return getattr(self._ds._evr, attr)(self._ds._current_evt, this_fiducial_only=True)
+        return self._codes.eventCodes_strict
 
     @property
     def eventCodes(self):
         """
         All event codes in current event
         """
-        attr = 'eventCodes'
-        return getattr(self._ds._evr, attr)(self._ds._current_evt)
+        return self._codes.eventCodes
+
+    @property
+    def timestampHigh(self):
+        """
+        timstampHigh dict from fifoEvents data
+        """
+        return self._codes.timestampHigh
+
+    @property
+    def timestampLow(self):
+        """
+        timstampLow dict from fifoEvents data
+        """
+        return self._codes.timestampLow
+
+    def _present(self, eventCode, strict=True):
+        """
+        Return True if the eventCode is present.
+        """
+        return self._codes._present(eventCode, strict=strict)
+
+    def present(self, *args, **kwargs):
+        """
+        Check if the event has specified event code.
+        Multiple event codes can be tested.
+
+        See Also
+        --------
+        EvrEventCodes.present
+        """
+        return self._codes.present(*args, **kwargs)
 
     @property
     def _ddls(self):
@@ -3835,37 +3940,166 @@ class EvrDataDetails(PsanaTypeData):
         fiducials = self.EventId.fiducials
         return [code for code, tsh in self.timestampHigh.items() if tsh == fiducials]
 
+    @property
+    def _codes(self):
+        """
+        EvrEventCodes decoded once for the current event.
+        """
+        return _get_evr_codes(self._ds)
+
     def _present(self, eventCode, strict=True):
         """
         Return True if the eventCode is present.
         """
+        return self._codes._present(eventCode, strict=strict)
+
+    def present(self, *args, **kwargs):
+        """
+        Check if the event has specified event code.
+        Multiple event codes can be tested.
+
+        See Also
+        --------
+        EvrEventCodes.present
+        """
+        return self._codes.present(*args, **kwargs)
+
+    @property
+    def eventCodes_strict(self):
+        """
+        eventcodes that were sent on precisely the fiducial corresponding to the evt.
+        """
+        return self._codes.eventCodes_strict
+
+    @property
+    def timestampHigh(self):
+        """
+        timstampHigh dict from fifoEvents data
+        """
+        return self._codes.timestampHigh
+
+    @property
+    def timestampLow(self):
+        """
+        timstampLow dict from fifoEvents data
+        """
+        return self._codes.timestampLow
+    
+    @property
+    def EventId(self):
+        """
+        EventId object
+        """
+        return EventId(self._ds._current_evt)
+
+
+    def show_table(self, **kwargs):
+        """Show table of event codes present'
+        """
+        message = Message(quiet=True, **kwargs)
+        ecs = self.fifoEvents
+        message('{:>6} {:>8} {:>8} {:>9}'.format('Code','TS_high', 'TS_low', 'Present'))
+        for i in range(self.numFifoEvents):
+            message('{:6} {:8} {:8}   {:}'.format(ecs.eventCode[i], 
+                            ecs.timestampHigh[i], ecs.timestampLow[i], self.present(ecs.eventCode[i])))
+        return message
+
+    def __str__(self):
         try:
-            if strict:
-                return self.timestampHigh[eventCode] == self.EventId.fiducials
-            else:
-                return eventCode in self.eventCodes
+            eventCodeStr = '{:}'.format(self.eventCodes)
         except:
-            pass
+            eventCodeStr = ''
+        
+        return eventCodeStr
 
-        if hasattr(self._typ_func, 'present'):
-            try:
-                pres = self._typ_func.present(eventCode)
-                if pres:
-                    if strict and self.timestampHigh[eventCode] != self.EventId.fiducials:
-                        return False
-                    else:
-                        return True
-                else:
-                    return False
-            except:
-                print('{:} {:}: error checking for eventCode {:}'.format(self.EventId, self, eventCode))
+    def __dir__(self):
+        all_attrs =  set(self.__dict__.keys() + dir(EvrDataDetails))
         
-        try:
-            return (eventCode in self.eventCodes)
-        except:
-            pass
-            
-        return False
+        return list(sorted(all_attrs))
+
+
+def _get_evr_codes(ds):
+    """
+    EvrEventCodes for the current event, decoded on first use and kept 
+    with the current event data.
+    """
+    key = ('EvrData', 'codes')
+    if key not in ds._current_data:
+        ds._current_data[key] = EvrEventCodes(ds)
+
+    return ds._current_data[key]
+
+
+class EvrEventCodes(object):
+    """
+    Evr fifo eventCodes for the current event in DataSource decoded once 
+    into bitsets and timestamp arrays over codes 0-255.
+
+    Only the EvrData of the DataSource evr (the source of ds._evr, otherwise 
+    the first EvrData source in the event) is used.
+
+    Parameters
+    ----------
+    ds : DataSource object
+    """
+    ncodes = 256
+
+    def __init__(self, ds):
+        import numpy as np
+        codes = []
+        timestampHigh = []
+        timestampLow = []
+        evr_src = getattr(ds, '_evr_src', None)
+        typ_func = None
+        for items in ds._evt_modules['EvrData'].values():
+            for typ, src, key in items:
+                if evr_src is not None and str(src) != evr_src:
+                    continue
+                typ_func = ds._current_evt.get(typ, src)
+                if typ_func is not None:
+                    break
+            if typ_func is not None:
+                break
+
+        if typ_func is not None:
+            for fifo in typ_func.fifoEvents():
+                codes.append(fifo.eventCode())
+                timestampHigh.append(fifo.timestampHigh())
+                timestampLow.append(fifo.timestampLow())
+
+        self.fiducials = ds._current_evt.get(psana.EventId).fiducials()
+        self.eventCodes = codes
+        self.eventCodes_strict = [code for code, tsh in zip(codes, timestampHigh) \
+                                    if tsh == self.fiducials]
+        self.timestampHigh = dict(zip(codes, timestampHigh))
+        self.timestampLow = dict(zip(codes, timestampLow))
+        
+        acodes = np.array(codes, dtype=int)
+        atimestampHigh = np.array(timestampHigh, dtype=np.int64)
+        ok = (acodes >= 0) & (acodes < self.ncodes)
+        self.bits = np.zeros(self.ncodes, dtype=bool)
+        self.bits[acodes[ok]] = True
+        self.bits_strict = np.zeros(self.ncodes, dtype=bool)
+        self.bits_strict[acodes[ok & (atimestampHigh == self.fiducials)]] = True
+        # timestamps indexed by eventCode (e.g., timestampLow_codes[eventCodes] in write_hdf5)
+        self.timestampHigh_codes = np.zeros(self.ncodes, dtype=np.uint32)
+        self.timestampHigh_codes[acodes[ok]] = atimestampHigh[ok]
+        self.timestampLow_codes = np.zeros(self.ncodes, dtype=np.uint32)
+        self.timestampLow_codes[acodes[ok]] = np.array(timestampLow, dtype=np.int64)[ok]
+
+    def _present(self, eventCode, strict=True):
+        """
+        Return True if the eventCode is present.
+        """
+        if 0 <= eventCode < self.ncodes:
+            if strict:
+                return bool(self.bits_strict[eventCode])
+            else:
+                return bool(self.bits[eventCode])
+        elif strict:
+            return eventCode in self.eventCodes_strict
+        else:
+            return eventCode in self.eventCodes
 
     def present(self, *args, **kwargs):
         """
@@ -3913,51 +4147,11 @@ class EvrDataDetails(PsanaTypeData):
 
         return True
 
-    @property
-    def timestampHigh(self):
-        """
-        timstampHigh dict from fifoEvents data
-        """
-        return dict(zip(self.fifoEvents.eventCode, self.fifoEvents.timestampHigh))
-
-    @property
-    def timestampLow(self):
-        """
-        timstampLow dict from fifoEvents data
-        """
-        return dict(zip(self.fifoEvents.eventCode, self.fifoEvents.timestampLow))
-    
-    @property
-    def EventId(self):
-        """
-        EventId object
-        """
-        return EventId(self._ds._current_evt)
-
-
-    def show_table(self, **kwargs):
-        """Show table of event codes present'
-        """
-        message = Message(quiet=True, **kwargs)
-        ecs = self.fifoEvents
-        message('{:>6} {:>8} {:>8} {:>9}'.format('Code','TS_high', 'TS_low', 'Present'))
-        for i in range(self.numFifoEvents):
-            message('{:6} {:8} {:8}   {:}'.format(ecs.eventCode[i], 
-                            ecs.timestampHigh[i], ecs.timestampLow[i], self.present(ecs.eventCode[i])))
-        return message
-
     def __str__(self):
-        try:
-            eventCodeStr = '{:}'.format(self.eventCodes)
-        except:
-            eventCodeStr = ''
-        
-        return eventCodeStr
+        return '{:}'.format(self.eventCodes)
 
-    def __dir__(self):
-        all_attrs =  set(self.__dict__.keys() + dir(EvrDataDetails))
-        
-        return list(sorted(all_attrs))
+    def __repr__(self):
+        return '< {:}: {:} >'.format(self.__class__.__name__, str(self))
 
 
 class EvrNullData(object):
@@ -4098,7 +4292,7 @@ class Detector(object):
         self._ds = ds
         self.src = ds._aliases.get(alias)
         if not self._xarray_info:
-            self._xarray_info.update({'coords': {}, 'dims': {}, 'attrs': {}})
+            self._xarray_info.update({'coords': {}, 'dims': {}, 'attrs': {}, 'dtypes': {}})
         
         self._source = ds.configData._sources.get(self.src)
         #
@@ -4189,6 +4383,8 @@ class Detector(object):
             Methods to add parameters, properties, and reduction/proccesing of data 
             with roi, projection, histogram methods.
         """
+        # AddOn definitions may change -- do not use cached values
+        self._reset_cached()
         return AddOn(self._ds, self._alias)
    
     @property
@@ -4217,6 +4413,8 @@ class Detector(object):
         import numpy as np
         # attrs -- not valid yet for bld but should fix this to avoid try/except here
         self._xarray_init = True
+        # data types for storage kept separate from the variable attrs
+        dtypes = {}
         try:
             attrs = {attr: item for attr, item in self.configData._all_values.items() \
                 if np.product(np.shape(item)) <= 17}
@@ -4331,14 +4529,24 @@ class Detector(object):
                     xattrs = {a: b for a, b in info.items() if a in ['doc','unit']}
                 else:
                     xattrs = {}
+                # data type to optionally narrow storage (see h5write.storage_profiles)
+                if npval.dtype.kind in 'biuf':
+                    dtypes[attr] = str(npval.dtype)
                 if npval.size > 1:
                     dims_dict[attr] = (['d{:}_{:}'.format(i,a) for i,a in enumerate(npval.shape)], npval.shape, xattrs)
                 else:
                     dims_dict[attr] = ([], (), xattrs)
 
 #            dims_dict = {attr: ([], ()) for attr in self.evtData._all_values}
+
+        if self._det_class == ImageData and 'raw' in dims_dict:
+            try:
+                dtypes['raw'] = str(self.raw.dtype)
+            except:
+                pass
                     
         self._xarray_info['dims'].update(**dims_dict)
+        self._xarray_info.setdefault('dtypes', {}).update(**dtypes)
 
         # coords
         if self._det_class == WaveformData:
@@ -4738,6 +4946,36 @@ class Detector(object):
         self._det_config['opts']['calib'].update({'cmpars': cmpars})
         self._pydet.calib(self._ds._current_evt, cmpars=cmpars)
 
+    def _get_cached(self, func, attr):
+        """
+        Get AddOn data only once per event.  
+        
+        Values are kept in the DataSource current event data with (alias, attr) keys
+        so that for example a count of an roi of calib data and the stats of 
+        the same roi share one calibration.  The cache is cleared with the 
+        current event data on the next event.
+
+        Parameters
+        ----------
+        func : method
+            Detector method to get the AddOn data (e.g., _get_roi)
+        attr : str
+            Attribute name
+        """
+        key = (self._alias, attr)
+        if key not in self._ds._current_data:
+            self._ds._current_data[key] = func(attr)
+
+        return self._ds._current_data[key]
+
+    def _reset_cached(self):
+        """
+        Clear cached AddOn data of the current event for this detector.
+        """
+        for key in [key for key in self._ds._current_data \
+                    if isinstance(key, tuple) and key[0] == self._alias]:
+            del self._ds._current_data[key]
+
     def _get_roi(self, attr):
         """
         Get roi from roi_name as defined by AddOn.
@@ -4857,13 +5095,14 @@ class Detector(object):
             if ichannel is not None:
                 wf = wf[ichannel]
 
+            # do not modify waveform in place since it is shared for the event
             background = item.get('background')
             if background:
-                wf -= background
+                wf = wf - background
 
             scale = item.get('scale')
             if scale:
-                wf *= scale
+                wf = wf * scale
 
             method = item.get('method')
             if method == 'waveform':
@@ -4903,6 +5142,10 @@ class Detector(object):
         import numpy as np
         import xarray as xr
         
+        if not stat_info.get('minmax', True):
+            # min and max are not kept
+            stats = [stat for stat in stats if stat not in ['min', 'max']]
+
         # Need to fix handling of coords to be robust
         #coords = stat_info.get('coords').copy()
         coords = {}
@@ -4971,15 +5214,12 @@ class Detector(object):
 
         axis = item['axis']
         if axis in ['r', 'az']:
-            # make a radial histogram
-            coord_compressed = item['coord_compressed']
-            mask = item['mask']
-            bins = item['bins']
-            norm = item['norm']
-            # make masked image with mask compressed
-            img_compressed = np.ma.masked_array(img, mask).compressed()
-            hst, hbins  = np.histogram(coord_compressed, bins=bins, weights=img_compressed)
-            return hst/norm
+            # sum the pixels in each bin with the precomputed pixel to bin map
+            pmap = item['map']
+            weights = np.asarray(img).ravel()[pmap['pixel_index']]
+            hst = np.bincount(pmap['bin_index'], weights=weights, 
+                              minlength=pmap['norm'].size)
+            return hst.reshape(pmap['norm'].shape)/item['norm']
             
         else:
             # perform method on oposite axis where psana convention is images have coordinates (x, y)
@@ -5022,19 +5262,19 @@ class Detector(object):
             return self._get_property(attr)
             
         if attr in self._det_config['count']:
-            return self._get_count(attr)
+            return self._get_cached(self._get_count, attr)
 
         if attr in self._det_config['histogram']:
-            return self._get_histogram(attr)
+            return self._get_cached(self._get_histogram, attr)
 
         if attr in self._det_config['roi']:
-            return self._get_roi(attr)
+            return self._get_cached(self._get_roi, attr)
        
         if attr in self._det_config['peak']:
-            return self._get_peak(attr)
+            return self._get_cached(self._get_peak, attr)
        
         if attr in self._det_config['projection']:
-            return self._get_projection(attr)
+            return self._get_cached(self._get_projection, attr)
 
         if attr in self._det_config['stats']:
             return self._get_stats(attr)
@@ -5220,10 +5460,11 @@ class AddOn(object):
         bin_size : float, optional
             Size of bins for polar coordinate projections.
             Default = pixelsize
-        rmin : float, optional
+        rmin : float or array, optional
             Minimum radius for az projection only 
             in units of calibData coords (e.g., calibData.coords_x, typically um)
-        rmax : float, optional
+            For arrays of rmin and rmax an az projection is made for each ring. 
+        rmax : float or array, optional
             Maximum radius for az projection only
             in units of calibData coords (e.g., calibData.coords_x, typically um)
         doc : str, optional
@@ -5349,63 +5590,99 @@ class AddOn(object):
 
             coords_r = np.sqrt(coords_y**2+coords_x**2)
             coords_az = np.degrees(np.arctan2(coords_y, coords_x))
+            rings = None
 
             if axis == 'r':
                 if not xunit:
                     xunit = 'um'
-                coord_hist = np.ma.masked_array(coords_r, mask)
-                if not bins:
+                coords = coords_r
+                masks = [mask]
+                if bins is None:
                     if not bin_size:
                         bin_size = calibData.pixel_size
                     if not bin_size:
                         bin_size = 1
 
-                    bins = np.arange(coord_hist.compressed().min()+bin_size*10, 
-                                     coord_hist.compressed().max()-bin_size*10., 
+                    coord_compressed = coords_r[~mask]
+                    bins = np.arange(coord_compressed.min()+bin_size*10, 
+                                     coord_compressed.max()-bin_size*10., 
                                      bin_size)
      
             else:
-                if rmin and rmax and np.array(rmin).size > 1 and np.array(rmax).size > 1:
-                    # in future
-                    print('Vectors for rmin and rmax not yet supported')
-                    return
+                coords = coords_az
+                if rmin is not None and rmax is not None \
+                        and (np.array(rmin).size > 1 or np.array(rmax).size > 1):
+                    # one az projection for each ring
+                    rmin, rmax = np.broadcast_arrays(np.array(rmin, dtype=float).ravel(), 
+                                                     np.array(rmax, dtype=float).ravel())
+                    masks = [mask | (coords_r < r0) | (coords_r >= r1) for r0, r1 in zip(rmin, rmax)]
+                    rings = (rmin+rmax)/2.
 
                 else:
                     if rmin:
                         # add logical or for rmin
-                        mask |= np.ma.masked_less(coords_r, rmin).mask
+                        mask |= coords_r < rmin
 
                     if rmax:
                         # add logical or for rmax
-                        mask |= np.ma.masked_greater_equal(coords_r, rmax).mask
+                        mask |= coords_r >= rmax
 
-                    coord_hist = np.ma.masked_array(coords_az, mask)
+                    masks = [mask]
                 
-                if not bins:
+                if bins is None:
                     if not bin_size:
                         bin_size = 2.
 
                     bins = np.arange(-180., 180., bin_size)
 
-            coord_compressed = coord_hist.compressed()
-            norm, hbins = np.histogram(coord_compressed, bins=bins)
+            if np.ndim(bins) == 0:
+                # equal width bins over the range of the pixel coordinates as in np.histogram
+                coord_compressed = np.concatenate([coords[~amask] for amask in masks])
+                bins = np.linspace(coord_compressed.min(), coord_compressed.max(), int(bins)+1)
+            
+            hbins = np.asarray(bins, dtype=float)
+            
+            # Projections of the same data with the same bins, mask and pixel 
+            # coordinates share one pixel to bin map
+            map_key = (roi_name, axis, tuple(hbins), 
+                       tuple(np.array(rmin).ravel()), tuple(np.array(rmax).ravel()))
+            pmap = None
+            for pitem in self._det_config['projection'].values():
+                if pitem.get('map_key') == map_key and np.array_equal(pitem.get('mask'), mask) \
+                        and np.array_equal(pitem.get('coords'), coords):
+                    pmap = pitem['map']
+                    coords = pitem['coords']
+                    break
+            
+            if pmap is None:
+                pmap = _projection_map(coords, masks, hbins)
+            
+            norm = pmap['norm']
             if method != 'norm':
                 norm = 1.
             
             projaxis = (hbins[1:]+hbins[0:-1])/2.
             self._det_config['xarray']['coords'].update({axis_name: projaxis})
 
-            self._det_config['xarray']['dims'].update(
-                    {name: ([axis_name], (projaxis.size))})
+            if rings is not None:
+                ring_name = 'ring'+roi_name
+                self._det_config['xarray']['coords'].update({ring_name: rings})
+                self._det_config['xarray']['dims'].update(
+                        {name: ([ring_name, axis_name], (rings.size, projaxis.size))})
+            else:
+                self._det_config['xarray']['dims'].update(
+                        {name: ([axis_name], (projaxis.size))})
 
             self._det_config['projection'].update(
                     {name: {'attr': roi_name, 
                             'axis': axis, 
                             'method': method,
                             'axis_name': axis_name,
-                            'coord_compressed': coord_compressed,
+                            'map': pmap,
+                            'map_key': map_key,
+                            'coords': coords,
                             'mask': mask,
-                            'bins': bins,
+                            'bins': hbins,
                             'rmin': rmin,
                             'rmax': rmax,
                             'norm': norm,
@@ -5645,7 +5922,8 @@ class AddOn(object):
         return name
 
     def stats(self, attr=None, doc=None, 
-            name=None, eventCodes=None, attrs={}, **kwargs):
+            name=None, eventCodes=None, attrs={}, block_size=1, 
+            dtype=None, minmax=True, **kwargs):
         """
         Calculate running statistics (mean, std, min, max, count) of detector data attribute 
         during event iteration using Welford algorithm.
@@ -5654,6 +5932,16 @@ class AddOn(object):
         ----------
         attr : str
             Name of data object in detector object on which to act
+        block_size : int
+            Number of events staged for each eventCode and step before 
+            updating the statistics together [default = 1, i.e., no staging].
+            Each staged event is kept as a float64 copy, so use small blocks 
+            for area detectors.
+        dtype : str
+            Storage type for the running mean and variance, e.g., 'float32' 
+            to halve the memory for area detectors [default = 'float64']
+        minmax : bool
+            Keep min and max [default = True]
         """
         if not name:
             name = attr+'_stats'
@@ -5726,6 +6014,9 @@ class AddOn(object):
                 'eventCodes': eventCodes,
                 'attrs': stat_attrs,
                 'stats': ['mean', 'std', 'min', 'max'],
+                'block_size': block_size,
+                'dtype': dtype,
+                'minmax': minmax,
                 }})
 
         return True
@@ -7476,11 +7767,20 @@ class TimeStamp(object):
 def _update_stats(evt):
     """
     Update Welford statistics.
+
+    Events are staged in blocks for each eventCode and step (see Welford block_size).
+    Blocks for the previous step are added and freed when the step changes.
     """
     from welford import Welford
     istep = evt._ds._istep
     for alias, det in evt._dets.items():
         for name, item in det._det_config['stats'].items():
+            if item.get('istep') != istep:
+                for funcs in item['funcs'].values():
+                    if item.get('istep') in funcs:
+                        funcs[item.get('istep')].flush(release=True)
+                item['istep'] = istep
+            
             attr = item['attr']
             vals = getattr_complete(det, attr)
             eventCodes = item['eventCodes']
@@ -7492,7 +7792,9 @@ def _update_stats(evt):
                             item['funcs'].update({ec: {}})
                         funcs = item['funcs'].get(ec) 
                         if istep not in funcs:
-                            funcs.update({istep: Welford()})
+                            funcs.update({istep: Welford(block_size=item.get('block_size'),
+                                                         dtype=item.get('dtype'),
+                                                         minmax=item.get('minmax', True))})
                         fec = funcs.get(istep)
                         try:
                             if not fec.shape or fec.shape == vals.shape:
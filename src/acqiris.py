@@ -16,6 +16,11 @@ class Acqiris(PyDataSource.Detector):
         else: 
             self.add.parameter(nchannels=4)
 
+        # peak_time options -- parabolic sub-sample interpolation of the max
+        # or constant fraction (cfd_fraction of the peak height) leading edge time
+        self.add.parameter(peak_interpolate=kwargs.get('peak_interpolate', False))
+        self.add.parameter(cfd_fraction=kwargs.get('cfd_fraction'))
+
     def _on_init(self):
 
         nchannels = self.nchannels
@@ -29,14 +34,56 @@ class Acqiris(PyDataSource.Detector):
         self.add.property(peak_time, **xattrs)
         self._xarray_info['dims'].update({'peak_time': (['ch'], nchannels, xattrs)}) 
         
+    def _get_peaks(self, attr=None):
+        """Peak height and time of all channels from the (nchannels, nsamples) 
+        waveform array.
+        """
+        wf = np.asarray(self.waveform)[:self.nchannels]
+        wt = np.asarray(self.wftime)[:self.nchannels]
+        nch, nsamples = wf.shape
+        ich = np.arange(nch)
+        imax = wf.argmax(axis=1)
+        height = wf[ich, imax]
+        time = wt[ich, imax]
+        
+        if self.cfd_fraction:
+            # last sample below the threshold before the max
+            threshold = self.cfd_fraction*height
+            below = (wf < threshold[:,np.newaxis]) & (np.arange(nsamples) < imax[:,np.newaxis])
+            ok = below.any(axis=1)
+            i0 = nsamples-1-below[:,::-1].argmax(axis=1)
+            i0 = np.where(ok, i0, imax)
+            i1 = np.minimum(i0+1, nsamples-1)
+            y0 = wf[ich, i0].astype(float)
+            dy = wf[ich, i1]-y0
+            with np.errstate(divide='ignore', invalid='ignore'):
+                frac = np.where(ok & (dy != 0), (threshold-y0)/dy, 0.)
+            time = np.where(ok, wt[ich, i0]+frac*(wt[ich, i1]-wt[ich, i0]), time)
+
+        elif self.peak_interpolate:
+            i0 = np.clip(imax, 1, nsamples-2)
+            y0 = wf[ich, i0-1].astype(float)
+            y1 = wf[ich, i0].astype(float)
+            y2 = wf[ich, i0+1].astype(float)
+            denom = y0-2.*y1+y2
+            ok = (imax == i0) & (denom != 0)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                delta = np.where(ok, 0.5*(y0-y2)/denom, 0.)
+            dt = np.where(delta < 0, wt[ich, i0]-wt[ich, i0-1], wt[ich, i0+1]-wt[ich, i0])
+            time = time+delta*dt
+
+        return {'height': height, 'time': time}
+
 def peak_height(self):
     """Max value of each waveform.
     """
-    return np.array([max(self.waveform[ch]) for ch in range(self.nchannels)])
+    return self._get_cached(self._get_peaks, 'peaks')['height']
 
 def peak_time(self):
     """Time of max of each waveform.
-    """
-    return np.array([self.wftime[ch][self.waveform[ch].argmax()] for ch in range(self.nchannels)])
-
 
+    With cfd_fraction set the time where the leading edge crosses
+    cfd_fraction of the peak height (linear interpolation between samples).
+    Otherwise with peak_interpolate the parabolic interpolated time of the max.
+    """
+    return self._get_cached(self._get_peaks, 'peaks')['time']
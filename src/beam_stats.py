@@ -1360,6 +1360,130 @@ def load_small_xarray(ds, path=None, filename=None, refresh=None,
     else:
         return None
 
+def _extraction_plan(evt, det, names):
+    """
+    Plan for reading detector attributes in make_small_xarray.
+
+    Attributes that are methods of the psana data types of the detector
+    (e.g., BldDataEBeam ebeamCharge) and give the same value as the Detector
+    attribute for the current event are read directly with one psana evt.get 
+    for each type.  Others (e.g., AddOns and detector properties) are read 
+    through the Detector.
+
+    Parameters
+    ----------
+    evt : EvtDetectors 
+        Current event with det present
+    det : str
+        Detector alias
+    names : dict
+        Dictionary of {name: attr}
+
+    Returns
+    -------
+    readers : list of ((typ, src, key), [(name, attr), ...])
+    others : dict of {name: attr} to read through the Detector
+    """
+    import numpy as np
+    readers = {}
+    others = {}
+    detector = getattr(evt, det)
+    psana_evt = evt._ds._current_evt
+    keys = evt._ds._evt_keys.get(getattr(detector, '_srcstr', None)) or []
+    for name, attr in names.items():
+        for typ, src, key in keys:
+            try:
+                if key:
+                    typ_func = psana_evt.get(typ, src, key)
+                else:
+                    typ_func = psana_evt.get(typ, src)
+                raw = np.asarray(getattr(typ_func, attr)(), dtype=float)
+                val = np.asarray(getattr(detector, attr), dtype=float)
+                if raw.shape == val.shape and ((raw == val) | (np.isnan(raw) & np.isnan(val))).all():
+                    readers.setdefault((typ, src, key), []).append((name, attr))
+                    break
+            except:
+                pass
+        else:
+            others[name] = attr
+
+    return readers.items(), others
+
+def _extract(evt, det, plan, data, i):
+    """
+    Read detector attributes for event i into data columns following an 
+    extraction plan from _extraction_plan.
+    """
+    import numpy as np
+    readers, others = plan
+    psana_evt = evt._ds._current_evt
+    for (typ, src, key), items in readers:
+        if key:
+            typ_func = psana_evt.get(typ, src, key)
+        else:
+            typ_func = psana_evt.get(typ, src)
+        for name, attr in items:
+            try:
+                data[name][i] = getattr(typ_func, attr)()
+            except:
+                data[name][i] = np.nan
+
+    if others:
+        detector = getattr(evt, det)
+        for name, attr in others.items():
+            try:
+                data[name][i] = getattr(detector, attr)
+            except:
+                data[name][i] = np.nan
+
+def _chunk_events(self, ichunk, nchunks, chunk_steps=False, nevents=None):
+    """
+    Event numbers in the run idx for chunk ichunk of nchunks.
+
+    Parameters
+    ----------
+    chunk_steps : bool
+        If True assign whole scan steps to the chunks in turn, 
+        otherwise split the run into nchunks contiguous event ranges.
+    nevents : int
+        Only use the first nevents of the run
+    """
+    import numpy as np
+    if not nevents:
+        nevents = self.nevents
+    
+    if hasattr(self.configData, 'ScanData') and self.configData.ScanData:
+        nsteps = self.configData.ScanData.nsteps
+    else:
+        nsteps = 1
+   
+    if chunk_steps and nsteps > 1:
+        scan_data = self.configData.ScanData._scanData
+        ievents = [np.arange(scan_data['ievent_start'][istep], 
+                             min([scan_data['ievent_end'][istep]+1, nevents]))
+                   for istep in range(ichunk, nsteps, nchunks)]
+        if ievents:
+            return np.concatenate(ievents)
+        else:
+            return np.array([], dtype=int)
+    
+    nchunk = int(np.ceil(nevents/float(nchunks)))
+    return np.arange(ichunk*nchunk, min([(ichunk+1)*nchunk, nevents]))
+
+def _iter_chunk_events(self, ievents):
+    """
+    Jump to each event number in ievents using the run idx times.
+    Yields event number and event.
+    """
+    for ievent in ievents:
+        try:
+            evt = self.events.next(evt_time=int(ievent))
+        except:
+            print('Cannot jump to event {:}'.format(ievent))
+            continue
+        
+        yield ievent, evt
+
 def make_small_xarray(self, auto_update=True,
         add_dets=True, add_counts=False, add_1d=True,
         ignore_unused_codes=True,
@@ -1367,18 +1491,26 @@ def make_small_xarray(self, auto_update=True,
         drop_code='ec162', drop_attr='delta_drop', 
         path=None, filename=None, save=True, engine='h5netcdf', 
         make_summary=True,
-        nevents=None):
+        nevents=None, mpi=False, chunk_steps=False):
     """Make Small xarray Dataset.
     Parameters
     ----------
     ignore_unused_codes : bool
         If true drop unused eventCodes except drop_code [default=True]
+    mpi : bool
+        If True split the events across the MPI ranks [default=False].
+        Each rank jumps to its own events and the filled rows are gathered 
+        on rank 0, which makes (and saves) the Dataset.  Other ranks return None.
+    chunk_steps : bool
+        With mpi assign whole scan steps to each rank instead of 
+        contiguous event ranges [default=False]
     """
     from xarray_utils import set_delta_beam
     from xarray_utils import clean_dataset
     from xarray_utils import to_summary
+    from xarray_utils import get_datetime64
     import numpy as np
-    import pandas as pd
+    import xarray as xr
     import time
     import os
     time0 = time.time() 
@@ -1493,13 +1625,34 @@ def make_small_xarray(self, auto_update=True,
 
         self.reload()
     
+    # Scalar data is filled in one preallocated event table
+    # and the Dataset is built from views of its columns
+    table = np.zeros(nevents, dtype=[(str(name), data[name].dtype) for name in sorted(data)])
+    data = {name: table[name] for name in table.dtype.names}
+    plans = {}
+    plans1d = {}
+
     nupdate = 100
     time_last = time0
     logger.info('Loading Scalar: {:}'.format(dets.keys()))
     if add_1d:
         logger.info('Loading 1D: {:}'.format(dets1d.keys()))
+    if mpi:
+        from mpi4py import MPI
+        comm = MPI.COMM_WORLD
+        rank = comm.Get_rank()
+        size = comm.Get_size()
+        # Loading ScanData in _chunk_events also sets the step when jumping to events
+        ievents = _chunk_events(self, rank, size, chunk_steps=chunk_steps, nevents=nevents)
+        logger.info('Rank {:} of {:} loading {:} events'.format(rank, size, len(ievents)))
+        # event number for each filled row to put the chunks back in order
+        aievent = np.zeros(nevents, dtype=int)
+        events = _iter_chunk_events(self, ievents)
+    else:
+        events = enumerate(self.events)
+
     i = 0
-    for evt in self.events:       
+    for ievent, evt in events:       
         # Skip events without event code with are only controls cameras 
         # nevents in ds does not include controls cameras
         if not evt.Evr.eventCodes:
@@ -1516,6 +1669,9 @@ def make_small_xarray(self, auto_update=True,
                     nevents, time_next-time0, nupdate/dtime))
             time_last = time_next 
 
+        if mpi:
+            aievent[i] = ievent
+
         # add step
         istep = self._istep
         data['step'][i] = istep
@@ -1535,31 +1691,38 @@ def make_small_xarray(self, auto_update=True,
             # Add detector attribute scalar data
             for det, attrs in dets.items():
                 if det == 'EventId' or det in evt._attrs:
-                    detector = getattr(evt, det)
-                    for name, attr in attrs['names'].items():
-                        try:
-                            data[name][i] = getattr(detector, attr)
-                        except:
-                            data[name][i] = np.nan
+                    if det not in plans:
+                        plans[det] = _extraction_plan(evt, det, attrs['names'])
+                    _extract(evt, det, plans[det], data, i)
             
             if add_1d:
                 # optionally add detector scalar data
                 for det, attrs in dets1d.items():
                     if det in evt._attrs:
-                        detector = getattr(evt, det)
-                        for name, attr in attrs['names'].items():
-                            try:
-                                data1d[name][i] = getattr(detector, attr)
-                            except:
-                                data[name][i] = np.nan
+                        if det not in plans1d:
+                            plans1d[det] = _extraction_plan(evt, det, attrs['names'])
+                        _extract(evt, det, plans1d[det], data1d, i)
                                 
         i += 1
 
-
-    df = pd.DataFrame(data)
-    x = df.to_xarray()
-    x = x.rename({'index':'time'})
-    x['time'] = [np.datetime64(int(sec*1e9+nsec), 'ns') for sec,nsec in zip(x.sec,x.nsec)]
+    if mpi:
+        # Gather the filled rows of all ranks and put them in event order
+        chunks = comm.gather((aievent[:i], table[:i], 
+                              {name: a[:i] for name, a in data1d.items()}), root=0)
+        if rank != 0:
+            return None
+        
+        order = np.argsort(np.concatenate([chunk[0] for chunk in chunks]), kind='mergesort')
+        i = len(order)
+        table[:i] = np.concatenate([chunk[1] for chunk in chunks])[order]
+        table[i:] = 0
+        for name, a in data1d.items():
+            a[:i] = np.concatenate([chunk[2][name] for chunk in chunks])[order]
+            a[i:] = 0
+        logger.info('Gathered {:} events from {:} ranks'.format(i, size))
+
+    x = xr.Dataset({name: ('time', col) for name, col in data.items()})
+    x['time'] = get_datetime64(x.sec, x.nsec)
     x.attrs['data_source'] = self.data_source.__str__()
     x.attrs['instrument'] = self.data_source.instrument.upper()
     x.attrs['run'] = self.data_source.run
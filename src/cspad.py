@@ -1,4 +1,5 @@
 import PyDataSource
+import traceback
 
 class Cspad(PyDataSource.Detector):
     """Cspad Detector Class.
@@ -14,14 +15,27 @@ class Cspad(PyDataSource.Detector):
             pass
 #        self.add.projection('corr', 'r', name='corr_r')
 
-        try:
-            self._init_streak(**kwargs)
-        except:
-            pass
+        if kwargs.get('streak'):
+            # jet streak information only on request (e.g., liquid jet experiments)
+            try:
+                self._init_streak(**kwargs)
+            except:
+                traceback.print_exc()
+                print('Cannot add jet streak information')
 
-    def _init_streak(self, beam_x=None, beam_y=None, **kwargs):
+    def _init_streak(self, beam_x=None, beam_y=None, 
+            streak_nangles=80, streak_angle_step=0.5, **kwargs):
         """
         Output cspad jet streak information 
+
+        Parameters
+        ----------
+        beam_x, beam_y : float
+            Beam center in calibData coords [default = 2094.93, -1796.57]
+        streak_nangles : int
+            Number of angles in streak angle grid [default = 80]
+        streak_angle_step : float
+            Angle step of streak angle grid in degrees [default = 0.5]
         """
         # try getting from 'CXI:SC1:DIFFRACT:BEAM_X' 
         if not beam_x:
@@ -29,13 +43,16 @@ class Cspad(PyDataSource.Detector):
         if not beam_y:
             beam_y = -1796.57
         
-        cy, cx = self.get_center(beam_x_pv, beam_y_pv)
-        j_map_1, j_map_2 = find_proj_mapping(cy, cx)
-        detector.add.parameter(proj_map_1 = j_map_1, proj_map_2 = j_map_2)
-        detector.add.property(streak_angle)
-        detector.add.property(streak_intensity)
-        detector.add.property(streak_width)
-        detector.add.property(streak_present)
+        cy, cx = self.get_center_coords((beam_y, beam_x))
+        cy -= 185
+        j_map_1, j_map_2 = find_proj_mapping(cy, cx, 
+                nangles=streak_nangles, angle_step=streak_angle_step)
+        self.add.parameter(proj_map_1 = j_map_1, proj_map_2 = j_map_2)
+        self.add.parameter(streak_angle_step=streak_angle_step)
+        self.add.property(streak_angle)
+        self.add.property(streak_intensity)
+        self.add.property(streak_width)
+        self.add.property(streak_present)
 
 
     def add_max_plot(self):
@@ -55,19 +72,22 @@ class Cspad(PyDataSource.Detector):
         Returns: jet angle, jet intensity (as standard deviations from the mean),
         jet width
         
+        Calculated once per event.
+        """
+        return self._get_cached(self._get_streak, 'streak_angle_raw')
+
+    def _get_streak(self, attr=None):
+        """
+        Jet streak angle, intensity and width from the projections of two 
+        inner asics along the streak angle grid given by proj_map_1 and proj_map_2.
         """
         import numpy as np
         from scipy.signal import peak_widths
 
         im1 = self.corr[1,-100:,:100]
         im2 = self.corr[17,-100:,:100]
-        proj1 = np.zeros((100,80))
-        proj2 = np.zeros((100,80))
-        for a in range(-40,40):
-            for i in range(im1.shape[0]):
-                proj1[i,a+40]=im1[i,self.proj_map_1[i,a+40]]
-                proj2[i,a+40]=im2[i,self.proj_map_2[i,a+40]]
-        s = proj1.sum(axis=0)+proj2.sum(axis=0)
+        rows = np.arange(im1.shape[0])[:,np.newaxis]
+        s = im1[rows, self.proj_map_1].sum(axis=0)+im2[rows, self.proj_map_2].sum(axis=0)
         s -= s.mean()
         s /= np.roll(s,10-s.argmax())[20:].std()
         peak = s[1:-1].argmax()+1
@@ -75,11 +95,12 @@ class Cspad(PyDataSource.Detector):
             peakwidth = peak_widths(s, [peak])[0][0]
         except Exception as e:
             peakwidth = 5
-        return (np.pi*(peak-40)/360.0, s.max(), peakwidth)
+        angle_step = self.streak_angle_step or 0.5
+        return (np.radians((peak-s.size//2)*angle_step), s.max(), peakwidth)
     
     def get_center(self, x0_pv, y0_pv):
         center = (y0_pv.get(), x0_pv.get())
-        cy, cx = get_center_coords(self, center)
+        cy, cx = self.get_center_coords(center)
         cy -= 185
         return cy, cx
 
@@ -103,7 +124,7 @@ class Cspad(PyDataSource.Detector):
         cy = np.zeros(4)
         cx = np.zeros(4)
         for i in range(4):
-            pos = to_pad_coord(self, center, i)
+            pos = self.to_pad_coord(center, i)
             cy[i], cx[i] = pos[0], pos[1]
         return cy, cx
 
@@ -154,24 +175,24 @@ def streak_present(self):
 
 def streak_present_im(im):
     '''im is 2D np-array'''
+    import numpy as np
     s = im[-10:].sum(axis=0)
     s -= s.mean()
     s /= np.roll(s,10-s.argmax())[20:].std()
     return s.max()>5
 
-def find_proj_mapping(cy,cx):
+def find_proj_mapping(cy, cx, nangles=80, angle_step=0.5):
+    """
+    Column index in each of 100 rows along lines through the beam center
+    for a grid of nangles angles with angle_step degrees.
+    """
     import numpy as np
     sq = 0
 
-    j_index_1 = np.zeros((100,80), dtype=np.int64)
-    j_index_2 = np.zeros((100,80), dtype=np.int64)
-    for a in range(-40,40):
-        ang = np.radians(float(a)/2)
-        for i in range(100):
-            j = int(np.tan(ang)*(100-i + cy[sq]) + cx[sq]) % 100
-            j_index_1[i,a+40]=j
-            j = int(np.tan(ang)*(100-i + cy[(sq+2)%4]) + cx[(sq+2)%4]) % 100
-            j_index_2[i,a+40]=j
+    ang = np.radians((np.arange(nangles)-nangles//2)*angle_step)
+    rows = (100-np.arange(100))[:,np.newaxis]
+    j_index_1 = (np.tan(ang)*(rows + cy[sq]) + cx[sq]).astype(np.int64) % 100
+    j_index_2 = (np.tan(ang)*(rows + cy[(sq+2)%4]) + cx[(sq+2)%4]).astype(np.int64) % 100
     return j_index_1, j_index_2
 
 
@@ -1,9 +1,15 @@
 import math
 import os
 import time
+import calendar
 import datetime
+import socket
+import threading
+import traceback
 import urllib
 import urllib2
+import urlparse
+import httplib
 import matplotlib.pyplot as plt
 import simplejson as json
 
@@ -14,6 +20,7 @@ pv_arg = "?pv={}"
 url_arg = "&{0}={1}"
 url_flag = "&{0}"
 date_spec_format   = "{0:04}-{1:02}-{2:02}T{3:02}:{4:02}:{5:02}.{6:03}Z"
+url_timeout = 60
 
 # From LCLS CDS blutil package
 
@@ -21,10 +28,27 @@ class EpicsArchive(object):
     """
     Class that accesses data from the new archiver.
     Currently supports getting points, plotting points, and searching for pvs.
+
+    Several pvs can be retrieved concurrently with get_json_many and in_archive.
+    
+    Parameters
+    ----------
+    cache_path : str, optional
+        Directory of a persistent cache of the retrieved data for each pv and 
+        time window (see _get_json_cached).
+    nthreads : int
+        Number of threads for concurrent requests [default = 8]
     """
-    def __init__(self):
+    cache_path = None
+    nthreads = 8
+    _search_cache = None
+
+    def __init__(self, cache_path=None, nthreads=8):
         self._pts_cache = None
         self._pv_cache = None
+        self.cache_path = cache_path
+        self.nthreads = nthreads
+        self._search_cache = {}
 
     def get_points(self, PV=None, start=30, end=None, unit="days", chunk=False, two_lists=False, raw=False):
         """
@@ -102,6 +126,66 @@ class EpicsArchive(object):
         else:
             return pvs
 
+    def in_archive(self, PVs):
+        """
+        Check if each of the PVs is in the archive with concurrent searches.
+        Returns dict of True/False for each PV.
+        """
+        return self._map(self._is_archived, PVs)
+
+    def _is_archived(self, PV):
+        """
+        Check if PV is in the archive (searched only once).
+        """
+        if self._search_cache is None:
+            self._search_cache = {}
+        if PV not in self._search_cache:
+            try:
+                self._search_cache[PV] = self.search_pvs(PV, do_print=False) != []
+            except:
+                traceback.print_exc()
+                print "Cannot search archive for {}".format(PV)
+                return False
+        
+        return self._search_cache[PV]
+
+    def get_json_many(self, PVs, start, end, chunk=False):
+        """
+        Do concurrent url queries of the archiver for several PVs over the same
+        time period.  Returns dict of the json result for each PV 
+        (None for PVs that could not be retrieved).
+        See _get_json for the arguments.
+        """
+        def get_json(PV):
+            try:
+                return self._get_json(PV, start, end, chunk)
+            except:
+                traceback.print_exc()
+                print "Cannot get {} from archive".format(PV)
+                return None
+        
+        return self._map(get_json, PVs)
+
+    def _map(self, func, items):
+        """
+        Apply func to each unique item with a pool of nthreads threads.
+        Returns dict of the results for each item.
+        """
+        items = sorted(set(items))
+        nthreads = min([self.nthreads or 1, len(items)])
+        if nthreads > 1:
+            from multiprocessing.pool import ThreadPool
+            pool = ThreadPool(nthreads)
+            try:
+                results = pool.map(func, items)
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            results = map(func, items)
+        
+        return dict(zip(items, results))
+
     def __interface(self):
         """
         Arguments:
@@ -168,6 +252,18 @@ class EpicsArchive(object):
             is a valid argument and would be the start of 2015. [2016, 4, 15]
             is a valid argument and would be the start of April 15, 2016.
         chunk: boolean for whether or not you want data to be chunked.
+
+        If a cache_path is set unchunked results are cached for each PV and
+        only data after the end of a cached request with the same start is fetched.
+        """
+        if self.cache_path and not chunk:
+            return self._get_json_cached(PV, start, end)
+        
+        return self._fetch_json(PV, start, end, chunk)
+
+    def _fetch_json(self, PV, start, end, chunk):
+        """
+        Url query of the new archiver (see _get_json).
         """
         url = retrieval_url
         url += pv_arg.format(urllib.quote(PV, safe=""))
@@ -177,6 +273,92 @@ class EpicsArchive(object):
             url += url_flag.format("donotchunk")
         return url_query(url)
 
+    def _get_json_cached(self, PV, start, end):
+        """
+        Unchunked url query using the cache in cache_path.
+
+        The cache file of each PV holds one entry for each requested start time.
+        A request within the window of an entry is sliced from the cache, and 
+        a request with a later end only fetches the data after the cached end.
+        """
+        start = list(start)
+        end = list(end)
+        tend = date_array_secs(end)
+        entries = self._read_cache(PV)
+        cached = None
+        for entry in entries:
+            if entry['start'] == start:
+                cached = entry
+                break
+        
+        if cached is not None and date_array_secs(cached['end']) >= tend:
+            json_obj = cached['json']
+            if json_obj:
+                json_obj[0]['data'] = [pt for pt in json_obj[0]['data'] 
+                                       if pt['secs'] <= tend]
+            return json_obj
+        
+        if cached is not None:
+            json_obj = cached['json']
+            new_obj = self._fetch_json(PV, cached['end'], end, False)
+            if not json_obj:
+                json_obj = new_obj
+            elif new_obj:
+                data = json_obj[0]['data']
+                if data:
+                    last = (data[-1]['secs'], data[-1].get('nanos', 0))
+                else:
+                    last = None
+                data.extend(pt for pt in new_obj[0]['data'] 
+                            if (pt['secs'], pt.get('nanos', 0)) > last)
+                if 'meta' in new_obj[0]:
+                    json_obj[0]['meta'] = new_obj[0]['meta']
+            entries.remove(cached)
+        else:
+            json_obj = self._fetch_json(PV, start, end, False)
+        
+        entries.append({'start': start, 'end': end, 'json': json_obj})
+        self._write_cache(PV, entries)
+        return json_obj
+
+    def _cache_file(self, PV):
+        """
+        Cache file name for PV.
+        """
+        return os.path.join(self.cache_path, urllib.quote(PV, safe="")+".json")
+
+    def _read_cache(self, PV):
+        """
+        Read list of cached requests for PV.
+        """
+        cache_file = self._cache_file(PV)
+        if not os.path.isfile(cache_file):
+            return []
+        try:
+            with open(cache_file, 'r') as f:
+                entries = json.load(f)
+            if isinstance(entries, dict):
+                entries = [entries]
+            return entries
+        except:
+            print "Cannot read archive cache {}".format(cache_file)
+            return []
+
+    def _write_cache(self, PV, entries):
+        """
+        Write list of cached requests for PV.
+        """
+        cache_file = self._cache_file(PV)
+        try:
+            if not os.path.isdir(self.cache_path):
+                os.makedirs(self.cache_path)
+            tmp_file = "{}.{}.{}".format(cache_file, os.getpid(), threading.current_thread().ident)
+            with open(tmp_file, 'w') as f:
+                json.dump(entries, f)
+            os.rename(tmp_file, cache_file)
+        except:
+            print "Cannot write archive cache {}".format(cache_file)
+
     def _json_to_pts(self, json_obj):
         """
         Inteprets a data retrieval json object as an array of tuple points.
@@ -204,11 +386,51 @@ days_map.update({ x: 1./24/60         for x in ("minutes", "mins", "min")
 days_map.update({ x: 1./24/60/60      for x in ("seconds", "secs", "sec", "s")     })
 days_map.update({ x: 1./24/60/60/1000 for x in ("milliseconds", "msec", "ms")      })
 
+_connections = threading.local()
+
+def _get_connection(netloc, reset=False):
+    """
+    Persistent http connection to netloc for the current thread.
+    """
+    conns = getattr(_connections, 'conns', None)
+    if conns is None:
+        conns = _connections.conns = {}
+    if reset and netloc in conns:
+        conns.pop(netloc).close()
+    if netloc not in conns:
+        conns[netloc] = httplib.HTTPConnection(netloc, timeout=url_timeout)
+    return conns[netloc]
+
 def url_query(url):
-    """Makes the URL request."""
-    req = urllib2.urlopen(url)
-    data = json.load(req)
-    return data
+    """Makes the URL request.
+    
+    http requests reuse a keep-alive connection for each host and thread.
+    """
+    parts = urlparse.urlsplit(url)
+    if parts.scheme != "http":
+        req = urllib2.urlopen(url)
+        data = json.load(req)
+        return data
+
+    path = parts.path
+    if parts.query:
+        path += "?" + parts.query
+    for retry in [False, True]:
+        # Retry once on a new connection if the server closed the old one
+        conn = _get_connection(parts.netloc, reset=retry)
+        try:
+            conn.request("GET", path)
+            resp = conn.getresponse()
+            body = resp.read()
+            break
+        except (httplib.HTTPException, socket.error):
+            if retry:
+                conn.close()
+                raise
+    
+    if resp.status != 200:
+        raise urllib2.HTTPError(url, resp.status, resp.reason, resp.msg, None)
+    return json.loads(body)
 
 def to_datetime(arg, unit):
     """
@@ -245,6 +467,14 @@ def date_format(year=2015, month=1, day=1, hr=0, min=0, s=0, ms=0):
     d = date_spec_format.format(year, month, day, hr, min, s, ms)
     return urllib.quote(d, safe="")
 
+def date_array_secs(arr):
+    """
+    Convert date array as used by date_format to unix time in seconds (UTC).
+    """
+    arr = list(arr) + [2015, 1, 1, 0, 0, 0, 0][len(arr):]
+    dt = datetime.datetime(*arr[:6])
+    return calendar.timegm(dt.timetuple()) + arr[6]/1000.
+
 def valid_date_arrays(start, end):
     """
     Checks if start is temporally before end.
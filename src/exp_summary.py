@@ -877,14 +877,24 @@ class ExperimentSummary(object):
 
         return self.xruns
 
-    def _init_arch(self, min_run=None, max_run=None, **kwargs):
+    def _init_arch(self, min_run=None, max_run=None, cache_path=None, nthreads=8, **kwargs):
         """
         Initialize archive
+
+        Parameters
+        ----------
+        cache_path : str
+            Path of epics archive cache [default = scratch RunSummary/epics_archive].
+            Use False to not cache archive data.
+        nthreads : int
+            Number of concurrent archive requests [default = 8]
         """
         from epicsarchive import EpicsArchive
         if not hasattr(self, 'xruns'):
             self._load_run_info()
-        self._arch = EpicsArchive()
+        if cache_path is None:
+            cache_path = os.path.join(self.scratch_dir, 'RunSummary', 'epics_archive')
+        self._arch = EpicsArchive(cache_path=cache_path, nthreads=nthreads)
         df = self.xruns.to_dataframe()
         if max_run:
             df = df[df.index <= max_run]
@@ -907,24 +917,40 @@ class ExperimentSummary(object):
             return vals[0]
 
 
+    def _get_pvs_from_arch(self, pvs, tstart=None, tend=None):
+        """
+        Get archive data for several pvs with concurrent requests.
+        Returns dict of data for each pv (None if not available).
+        """
+        if not tstart:
+            tstart = self._tstart
+        if not tend:
+            tend = self._tend
+        vals = self._arch.get_json_many(pvs, tstart, tend, False)
+        return {pv: val[0] if val else None for pv, val in vals.items()}
+
     def _in_archive(self, pv):
         """
         Check if pv is in archive.
         """
-        return self._arch.search_pvs(pv, do_print=False) != []
+        return self._arch.in_archive([pv])[pv]
 
     def _load_eventCodes(self):
         """Currently not archived
         """
         data_codes = {}
         seq_evtCodes = range(67,99)+range(167,199)+range(201,217)
+        code_pvs = {}
         for num in seq_evtCodes:
-            pvs = {
+            code_pvs[num] = {
                     'inst_num': 'ECS:SYS0:0:EC_{:}_OWNER_ID'.format(num),
                     'desc': 'EVNT:SYS0:1:NAME{:}'.format(num),
                     #'ticks': 'EVNT:SYS0:1:ECS_{:}DLY.A'.format(num),
                   }
-            data_codes[num] = {name: self._get_pv_from_arch(pv) for name, pv in pvs.items()}
+        
+        pv_data = self._get_pvs_from_arch([pv for pvs in code_pvs.values() for pv in pvs.values()])
+        for num, pvs in code_pvs.items():
+            data_codes[num] = {name: pv_data.get(pv) for name, pv in pvs.items()}
 
         self._data_codes = data_codes
 
@@ -1045,7 +1071,16 @@ class ExperimentSummary(object):
         #pvmots = {pv.rstrip('.RBV'): alias+'_set' for pv, alias in pvnames.items() if pv.endswith('RBV')}
         #pvnames.update(**pvmots)
         #pvs = {pv: alias for pv, alias in pvnames.items() if arch.search_pvs(pv, do_print=False) != []} 
-        pvs = {pv: alias for pv, alias in pvnames.items() if self._in_archive(pv)} 
+        archived = self._arch.in_archive(pvnames)
+        pvs = {pv: alias for pv, alias in pvnames.items() if archived[pv]} 
+        
+        # Fetch pvs and their field pvs with concurrent requests 
+        pv_data = self._get_pvs_from_arch(pvs)
+        pv_descs = [pv.split('.')[0]+'.'+item[0] for pv in pvs if pv_data.get(pv) 
+                    for item in self._fields.values()]
+        archived = self._arch.in_archive(pv_descs)
+        pv_descs = [pv_desc for pv_desc in pv_descs if archived[pv_desc]]
+        desc_data = self._get_pvs_from_arch(pv_descs)
 
         meta_attrs = {'units': 'EGU', 'PREC': 'PREC', 'pv': 'name'}
 
@@ -1058,7 +1093,7 @@ class ExperimentSummary(object):
         time_last = time0
         for pv, alias in pvs.items():
             data_fields[alias] = {}
-            dat = self._get_pv_from_arch(pv)
+            dat = pv_data.get(pv)
             if dat:
                 try:
                     attrs = {a: dat['meta'].get(val) for a,val in meta_attrs.items() if val in dat['meta']}
@@ -1066,8 +1101,8 @@ class ExperimentSummary(object):
                         try:
                             field=item[0]
                             pv_desc = pv.split('.')[0]+'.'+field
-                            if self._in_archive(pv_desc):
-                                desc = self._get_pv_from_arch(pv_desc)
+                            if pv_desc in desc_data:
+                                desc = desc_data[pv_desc]
                                 if desc:
                                     vals = {}
                                     fattrs = attrs.copy()
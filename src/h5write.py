@@ -82,7 +82,7 @@ def runstr_to_array(runstr, portable=False):
 
 def read_netcdfs(files, dim='time', 
         make_cuts=True,
-        transform_func=None, engine='h5netcdf'):
+        transform_func=None, engine='h5netcdf', chunks=None):
     """
     Read netcdf files and return concatenated xarray Dataset object
 
@@ -97,28 +97,19 @@ def read_netcdfs(files, dim='time',
         Method to transform each Dataset before concatenating
     engine : str
         Engine for loading files.  default = 'h5netcdf'
+    chunks : dict
+        dask chunks to load data lazily, e.g., {'time': 1000}.
+        Default None loads all data into memory.
 
     """
     import glob
     import xarray as xr
     def process_one_path(path):
-        # use a context manager, to ensure the file gets closed after use
-        with xr.open_dataset(path, engine=engine) as ds:
-            if 'nevents' in ds.attrs:
-                try:
-                    ds = ds.isel(time=slice(None, ds.nevents))
-                except:
-                    traceback.print_exc()
-                    print 'cannot select', ds.nevents
-            ds['time'] = [np.datetime64(int(sec*1e9+nsec), 'ns') for sec,nsec in zip(ds.sec.values,ds.nsec.values)]
-            # transform_func should do some sort of selection or
-            # aggregation
-            if transform_func is not None:
-                ds = transform_func(ds)
-            # load all data from the transformed dataset, to ensure we can
-            # use it after closing each original file
-            ds.load()
-            return ds
+        ds = process_one_file(path, transform_func=transform_func, 
+                engine=engine, chunks=chunks)
+        if dim not in ds.dims:
+            raise Exception('No {:} dimension in {:}'.format(dim, path))
+        return ds
 
     paths = sorted(glob.glob(files))
     datasets = []
@@ -157,9 +148,16 @@ def read_netcdfs(files, dim='time',
 
 #ds = PyDataSource.DataSource('exp=cxij4915:run=49:smd')
 def open_h5netcdf(file_name=None, path='', file_base=None, exp=None, run=None, 
-        h5folder='scratch', subfolder='nc', chunk=False, combine=None, summary=False, **kwargs):
+        h5folder='scratch', subfolder='nc', chunk=False, combine=None, summary=False, 
+        chunks=None, **kwargs):
     """
     Open hdf5 file with netcdf4 convention using builtin xarray engine h5netcdf.
+
+    Parameters
+    ----------
+    chunks : dict
+        dask chunks to load data lazily when combining files, e.g., {'time': 1000}.
+        Default None loads all data of combined files into memory.
     """
     import xarray as xr
     if exp:
@@ -182,7 +180,7 @@ def open_h5netcdf(file_name=None, path='', file_base=None, exp=None, run=None,
             file_name = os.path.join(path,file_base+'.nc')
 
         try:
-            return xr.open_dataset(file_name, engine='h5netcdf')
+            return xr.open_dataset(file_name, engine='h5netcdf', chunks=chunks)
         except:
             combine = True
 
@@ -193,12 +191,12 @@ def open_h5netcdf(file_name=None, path='', file_base=None, exp=None, run=None,
             else:
                 file_name = '{:}/run{:04}_*.nc'.format(path, int(run))
 
-        return read_netcdfs(file_name, make_cuts=False)
+        return read_netcdfs(file_name, make_cuts=False, chunks=chunks)
  
     elif chunk and run:
         file_names = '{:}/run{:04}_c*.nc'.format(path, int(run))
         if True:
-            x = read_netcdfs(file_names, make_cuts=False)
+            x = read_netcdfs(file_names, make_cuts=False, chunks=chunks)
         else:
             import glob
             files = glob.glob(file_names)
@@ -255,37 +253,68 @@ def to_h5netcdf(xdat=None, ds=None, file_name=None, path=None,
 
     return xdat
 
-def process_one_file(file_name, transform_func=None, engine='h5netcdf'):
+def _prepare_dataset(ds, transform_func=None):
+    """
+    Select nevents and make time coordinate from sec and nsec for Dataset
+    loaded from file written by write_hdf5. 
+    """
+    if 'nevents' in ds.attrs and 'time' in ds.dims:
+        try:
+            ds = ds.isel(time=slice(None, ds.nevents))
+        except:
+            traceback.print_exc()
+            print 'cannot select', ds.nevents
+
+    if 'time' in ds.dims:
+        ds['time'] = get_datetime64(ds.sec, ds.nsec)
+    
+    # transform_func should do some sort of selection or
+    # aggregation
+    if transform_func is not None:
+        ds = transform_func(ds)
+   
+    return ds
+
+def process_one_file(file_name, transform_func=None, engine='h5netcdf', chunks=None):
     """Load one file
+
+    Parameters
+    ----------
+    chunks : dict
+        dask chunks to load data lazily, e.g., {'time': 1000}.
+        Default None loads all data into memory and closes the file.
     """
     import xarray as xr
     import os
     if not os.path.isfile(file_name):
         return
+    
+    if chunks is not None:
+        # keep file open for lazy loading
+        ds = xr.open_dataset(file_name, engine=engine, chunks=chunks)
+        return _prepare_dataset(ds, transform_func=transform_func)
+
     # use a context manager, to ensure the file gets closed after use
     with xr.open_dataset(file_name, engine=engine) as ds:
-        if 'nevents' in ds.attrs and 'time' in ds.dims:
-            try:
-                ds = ds.isel(time=slice(None, ds.nevents))
-            except:
-                traceback.print_exc()
-                print 'cannot select', ds.nevents
-
-        if 'time' in ds.dims:
-            ds['time'] = [np.datetime64(int(sec*1e9+nsec), 'ns') for sec,nsec in zip(ds.sec.values,ds.nsec.values)]
-        
-        # transform_func should do some sort of selection or
-        # aggregation
-        if transform_func is not None:
-            ds = transform_func(ds)
+        ds = _prepare_dataset(ds, transform_func=transform_func)
         # load all data from the transformed dataset, to ensure we can
         # use it after closing each original file
         ds.load()
         return ds
 
 def merge_datasets(file_names, engine='h5netcdf', 
-            save_file=None, cleanup=True, quiet=False):
+            save_file=None, cleanup=True, quiet=False, chunks=None):
     """
+    Merge Datasets from files written by write_hdf5.
+
+    Parameters
+    ----------
+    save_file : str
+        Optional file name to save merged Dataset
+    chunks : dict
+        dask chunks to load data lazily, e.g., {'time': 1000}, 
+        so that the merged Dataset is written to save_file chunk by chunk 
+        Default None loads all data into memory.
     """
     import xarray as xr
     datasets = []
@@ -294,7 +323,7 @@ def merge_datasets(file_names, engine='h5netcdf',
         #det = file_name.split('/run')[1].split('_')[2].split('.')[0]
         try:
             print 'processing', file_name
-            xo = process_one_file(file_name, engine=engine)
+            xo = process_one_file(file_name, engine=engine, chunks=chunks)
             #skip files with no data
             if xo.data_vars.keys():
                 det = xo.attrs.get('alias')
@@ -329,12 +358,185 @@ def merge_datasets(file_names, engine='h5netcdf',
 
     return x, xattrs
 
+def merge_chunk(path, file_base, ichunk, engine='h5netcdf', quiet=False, chunks=None):
+    """
+    Merge the detector files of one chunk written by write_hdf5 
+    (e.g., run0010_C03_*.nc) into a single chunk file (e.g., run0010_C03.nc)
+    that read_chunked loads directly.  Used by read_chunked for chunks that 
+    are not yet merged and by to_hdf5_mpi so that each rank merges its own 
+    chunk in parallel.
+
+    Parameters
+    ----------
+    path : str
+        Path of chunk files
+    file_base : str
+        Base of file names (e.g., run0010)
+    ichunk : int
+        Chunk index
+    
+    Returns
+    -------
+    Name of merged chunk file
+    """
+    import glob
+    file_names = glob.glob('{:}//{:}_C{:02}_*.nc'.format(path,file_base,ichunk))
+    file_names = [f for f in file_names if not f.endswith('stats.nc')]
+    if not file_names:
+        return None
+
+    save_file = '{:}//{:}_C{:02}.nc'.format(path,file_base,ichunk)
+    merge_datasets(file_names, engine=engine, save_file=save_file, quiet=quiet, chunks=chunks)
+    
+    return save_file
+
+def write_virtual_run(chunk_files, file_name, dim='time', 
+        omit_attrs=['ichunk', 'nevents']):
+    """
+    Write a run file of hdf5 virtual datasets (VDS) that map onto chunk files
+    instead of copying the chunk data.  The file follows the netcdf4 
+    conventions used by h5netcdf so it can be opened with open_h5netcdf 
+    or xarray.open_dataset(file_name, engine='h5netcdf').
+    Requires hdf5 >= 1.10 and h5py >= 2.9.
+
+    Variables along dim are virtual and concatenated in the order of chunk_files
+    (events missing in a chunk are filled with nan or 0).  
+    Time variables encoded with 'units since' are decoded and written with 
+    a common reference time, and variables without dim are copied from the 
+    first chunk that has them.  The chunk files are referenced relative to the 
+    run file and must be kept in the same relative location.
+
+    Parameters
+    ----------
+    chunk_files : list
+        Chunk files (e.g., run0010_C00.nc, run0010_C01.nc) in time order
+    file_name : str
+        Name of run file
+    dim : str
+        Dimension along which chunks are concatenated
+    omit_attrs : list
+        File attributes of chunks not to be copied to the run file
+    """
+    import h5py
+    import h5netcdf
+    import xarray as xr
+    not_a_variable = b'This is a netCDF dimension but not a netCDF variable.'
+    dim_attrs = ['CLASS', 'NAME', 'REFERENCE_LIST', 'DIMENSION_LIST', 
+                 '_Netcdf4Dimid', '_Netcdf4Coordinates', '_NCProperties']
+    
+    # variable info from chunks
+    variables = {}
+    dimensions = {}
+    sizes = []
+    for ichunk, chunk_file in enumerate(chunk_files):
+        with h5netcdf.File(chunk_file, 'r') as f:
+            size = f[dim].shape[0]
+            sizes.append(size)
+            for name, var in f.variables.items():
+                if name not in variables:
+                    variables[name] = {'dims': var.dimensions, 'shape': var.shape[1:],
+                                       'dtype': var.dtype, 'chunks': {}}
+                    for d, n in zip(var.dimensions, var.shape):
+                        dimensions.setdefault(d, n)
+                    
+                    attrs = var.attrs
+                    variables[name]['decode'] = dim in var.dimensions \
+                            and 'since' in str(attrs.get('units', ''))
+                
+                if var.dimensions and var.dimensions[0] == dim \
+                        and var.shape[1:] == variables[name]['shape']:
+                    variables[name]['chunks'][ichunk] = size
+
+    ntime = sum(sizes)
+    dimensions[dim] = ntime
+    istarts = np.cumsum([0]+sizes)
+    path = os.path.dirname(os.path.abspath(file_name))
+    
+    with h5py.File(file_name, 'w') as fout:
+        with h5py.File(chunk_files[0], 'r') as f0:
+            for attr, val in f0.attrs.items():
+                if attr not in omit_attrs and attr not in dim_attrs:
+                    fout.attrs[attr] = val
+        
+        for name, info in sorted(variables.items()):
+            dims = info['dims']
+            if info['decode']:
+                # decode times from all chunks with a common reference
+                vals = np.zeros(ntime, dtype=np.int64)
+                for ichunk, chunk_file in enumerate(chunk_files):
+                    if ichunk in info['chunks']:
+                        with xr.open_dataset(chunk_file, engine='h5netcdf') as xchunk:
+                            tvals = xchunk[name].values.astype('datetime64[ns]').astype(np.int64)
+                        vals[istarts[ichunk]:istarts[ichunk+1]] = tvals
+                
+                ds = fout.create_dataset(name, data=vals)
+                attrs = {'units': 'nanoseconds since 1970-01-01', 
+                         'calendar': 'proleptic_gregorian'}
+            
+            elif dims and dims[0] == dim:
+                dtype = info['dtype']
+                shape = (ntime,)+tuple(info['shape'])
+                layout = h5py.VirtualLayout(shape=shape, dtype=dtype)
+                for ichunk, size in info['chunks'].items():
+                    source_file = os.path.relpath(os.path.abspath(chunk_files[ichunk]), path)
+                    vsource = h5py.VirtualSource(source_file, name, shape=(size,)+shape[1:])
+                    layout[istarts[ichunk]:istarts[ichunk]+size] = vsource
+                
+                if dtype.kind == 'f':
+                    fillvalue = np.nan
+                else:
+                    fillvalue = 0
+                ds = fout.create_virtual_dataset(name, layout, fillvalue=fillvalue)
+                attrs = None
+            
+            else:
+                ds = None
+                for ichunk, chunk_file in enumerate(chunk_files):
+                    with h5py.File(chunk_file, 'r') as f:
+                        if name in f:
+                            ds = fout.create_dataset(name, data=f[name][...])
+                            break
+                attrs = None
+
+            if ds is None:
+                continue
+
+            if attrs is None:
+                for ichunk, chunk_file in enumerate(chunk_files):
+                    with h5py.File(chunk_file, 'r') as f:
+                        if name in f:
+                            attrs = {attr: val for attr, val in f[name].attrs.items() \
+                                        if attr not in dim_attrs}
+                            break
+            
+            for attr, val in attrs.items():
+                ds.attrs[attr] = val
+        
+        # netcdf4 dimension scales
+        for d, n in dimensions.items():
+            if d in fout:
+                fout[d].make_scale(d)
+            else:
+                ds = fout.create_dataset(d, (n,), dtype='f4')
+                ds.make_scale(not_a_variable+b'{:10}'.format(n))
+
+        for name, info in variables.items():
+            if name in fout:
+                for i, d in enumerate(info['dims']):
+                    if d != name:
+                        fout[name].dims[i].attach_scale(fout[d])
+
+    return file_name
+
 def merge_stats(run=None, path=None, exp=None, dim='steps', 
         h5folder='scratch', subfolder='nc',
         engine='h5netcdf', quiet=False, **kwargs):
     """
     Read netcdf chunked stats 
 
+    Means and variances are pooled exactly from the number of events
+    in each chunk, so the result does not depend on how the run was split.
+
     Parameters
     ----------
     dim : str
@@ -346,6 +548,7 @@ def merge_stats(run=None, path=None, exp=None, dim='steps',
     """
     import xarray as xr
     import glob
+    from welford import merge_moments
     if not run:
         raise Exception('run must be provided')
 
@@ -359,7 +562,7 @@ def merge_stats(run=None, path=None, exp=None, dim='steps',
                 exp,h5folder,subfolder,run)
     
     files = sorted(glob.glob('{:}/run{:04}_*stats.nc'.format(path, run)))
-    if files:
+    if not files:
         return None
     
     xdata = {}
@@ -371,7 +574,7 @@ def merge_stats(run=None, path=None, exp=None, dim='steps',
         steps = xdat.get(dim)
         if steps is not None:
             for step in xdat.steps.values:
-                x = xdat.sel(steps=step)
+                x = xdat.sel(steps=step).load()
                 dattrs = [a for a in x.coords if a != dim and x.coords[a].dims == ()]
                 if dattrs:
                     x = x.drop(dattrs)
@@ -385,34 +588,60 @@ def merge_stats(run=None, path=None, exp=None, dim='steps',
                     elif xdata[step].codes.size > x.codes.size:
                         x = x.reindex_like(xdata[step])
 
-                    for attr, item in xdata[step].coords.items():
-                        if attr.endswith('events') and attr in x.coords:
-                            item.values += x.coords[attr].values
+                    # number of events for each code -- missing codes are nan after reindex
+                    nattrs = [attr for attr in xdata[step].coords \
+                                if attr.endswith('events') and attr in x.coords]
+                    snevents = {attr: np.nan_to_num(xdata[step].coords[attr].values) for attr in nattrs}
+                    xnevents = {attr: np.nan_to_num(x.coords[attr].values) for attr in nattrs}
+                    
                     for attr, item in xdata[step].data_vars.items():
                         stats = item.stat.values
                         istats = {stat:i for i,stat in enumerate(list(stats))}
-                        stat = 'min'
-                        if stat in stats:
-                            item[istats[stat]] = np.minimum(item.sel(stat=stat).values, 
-                                                            x[attr].sel(stat=stat).values)
-                        stat = 'max'
-                        if stat in stats:
-                            item[istats[stat]] = np.maximum(item.sel(stat=stat).values, 
-                                                            x[attr].sel(stat=stat).values)
-                        stat = 'var'
-                        if stat in stats:
-                            xvar = x[attr].sel(stat=stat).values
-                            svar = item.sel(stat=stat).values
-                            item[istats[stat]] = 1./(1./xvar+1./svar)
+                        nattr = [a for a in item.coords if a in nattrs]
+                        for stat, func in [('min', np.fmin), ('max', np.fmax)]:
+                            if stat not in stats:
+                                continue
+                            sval = item.sel(stat=stat).values
+                            xval = x[attr].sel(stat=stat).values
+                            val = func(sval, xval)
+                            if nattr:
+                                # cells without events in one chunk take the other chunk value
+                                sn = snevents[nattr[0]]
+                                sn = sn.reshape(sn.shape+(1,)*(sval.ndim-sn.ndim))
+                                xn = xnevents[nattr[0]]
+                                xn = xn.reshape(xn.shape+(1,)*(xval.ndim-xn.ndim))
+                                val = np.where(sn > 0, np.where(xn > 0, val, sval), xval)
+                            item[istats[stat]] = val
+                        
+                        if not nattr or 'mean' not in stats:
+                            continue
                         
-                        if 'mean' in stats and 'std' in stats:
+                        # Pool mean and variance exactly from the number of events in each chunk
+                        if 'var' in stats:
+                            svar = item.sel(stat='var').values
+                            xvar = x[attr].sel(stat='var').values
+                        elif 'std' in stats:
                             svar = item.sel(stat='std').values**2
                             xvar = x[attr].sel(stat='std').values**2
-                            smean = item.sel(stat='mean').values
-                            xmean = x[attr].sel(stat='mean').values
-                            sxvar = 1./(1./xvar+1./svar)
-                            item[istats['mean']] = (xmean/xvar+smean/svar)*sxvar
-                            item[istats['std']] = np.sqrt(sxvar)
+                        else:
+                            continue
+
+                        smean = item.sel(stat='mean').values
+                        xmean = x[attr].sel(stat='mean').values
+                        sn = snevents[nattr[0]]
+                        sn = sn.reshape(sn.shape+(1,)*(smean.ndim-sn.ndim))
+                        xn = xnevents[nattr[0]]
+                        xn = xn.reshape(xn.shape+(1,)*(xmean.ndim-xn.ndim))
+                        n, mean, var = merge_moments(sn, smean, svar, xn, xmean, xvar)
+                        item[istats['mean']] = mean
+                        if 'var' in stats:
+                            item[istats['var']] = var
+                        if 'std' in stats:
+                            item[istats['std']] = np.sqrt(var)
+
+                    for attr in nattrs:
+                        item = xdata[step].coords[attr]
+                        xdata[step].coords[attr] = (item.dims, snevents[attr]+xnevents[attr])
 
     if not xdata:
         x = None
@@ -428,6 +657,7 @@ def read_chunked(run=None, path=None, exp=None, dim='time',
         merge=False, quiet=False,
         save=True, save_path=None,
         cleanup=True, 
+        assemble='copy', chunks=None,
         transform_func=None, engine='h5netcdf', **kwargs):
     """
     Read netcdf files and return concatenated xarray Dataset object
@@ -443,6 +673,16 @@ def read_chunked(run=None, path=None, exp=None, dim='time',
         Method to transform each Dataset before concatenating
     engine : str
         Engine for loading files.  default = 'h5netcdf'
+    assemble : str
+        How the run file is saved.
+        'copy' [default]: all chunks are loaded, concatenated and written to the run file.
+        'virtual': merged chunk files are kept and the run file is written with 
+        hdf5 virtual datasets that map onto them (see write_virtual_run).
+        Default cuts are then only applied to the returned Dataset.
+    chunks : dict
+        dask chunks to load data lazily, e.g., {'time': 1000}, so that chunks 
+        are written to the run file without loading all data into memory.
+        Default None loads all data into memory.
 
     """
     #exp='cxilr6716';run=121;dim='time';h5folder='scratch';subfolder='nc';omit_attrs=['ichunk', 'nevents'];make_cuts=True;merge=False;quiet=False;save=False;save_path=None;cleanup=False;transform_func=None
@@ -471,33 +711,36 @@ def read_chunked(run=None, path=None, exp=None, dim='time',
     files = [f for f in glob.glob('{:}/run{:04}_*.nc'.format(path, run)) if not f.endswith('stats.nc')]
     #dets = set([a.lstrip('{:}/run{:04}_'.format(path,run)).split('_')[1].split('.')[0] for a in files])
     datachunks = []
-    chunks = set([int(a.lstrip('{:}/run{:04}_'.format(path,run)).lstrip('C').split('.')[0].split('_')[0]) for a in files])
+    ichunks = set([int(a.lstrip('{:}/run{:04}_'.format(path,run)).lstrip('C').split('.')[0].split('_')[0]) for a in files])
+    if save and assemble == 'virtual':
+        return _assemble_virtual(run, path, ichunks, merge=merge, 
+                make_cuts=make_cuts, save=save, save_path=save_path, cleanup=cleanup,
+                engine=engine, quiet=quiet)
+
     xattrs = {}
-    axattrs = {}
-    for chunk in chunks:
-        merge_chunk = False
+    for chunk in ichunks:
+        do_merge = False
         file_name = '{:}//run{:04}_C{:02}.nc'.format(path,run,chunk)
         if not merge and os.path.isfile(file_name):
             try:
                 if not quiet:
                     print 'Loading chunk', chunk
-                x = process_one_file(file_name)
+                x = process_one_file(file_name, chunks=chunks)
             except:
-                merge_chunk = True
+                do_merge = True
         else:
-            merge_chunk = True
+            do_merge = True
 
-        if merge or merge_chunk:
+        if merge or do_merge:
             if not quiet:
                 print 'Merging chunk', chunk
-            file_names = glob.glob('{:}//run{:04}_C{:02}_*.nc'.format(path,run,chunk))
-            file_names = [f for f in file_names if not f.endswith('stats.nc')]
-            save_file = '{:}//run{:04}_C{:02}.nc'.format(path,run,chunk)
-            #x = merge_datasets(file_names, save_file=save_file, quiet=quiet)
-            x, cxattrs = merge_datasets(file_names, quiet=quiet)
-            axattrs[chunk] = cxattrs
-
-        if len(chunks) > 1:
+            file_name = merge_chunk(path, 'run{:04}'.format(run), chunk, 
+                    engine=engine, quiet=quiet, chunks=chunks)
+            if not file_name:
+                continue
+            x = process_one_file(file_name, chunks=chunks)
+
+        if len(ichunks) > 1:
             datachunks.append(x)
             try:
                 xattrs[chunk] = x.attrs
@@ -505,7 +748,7 @@ def read_chunked(run=None, path=None, exp=None, dim='time',
                 traceback.print_exc()
                 return xchunk
 
-    if len(chunks) > 1:
+    if len(ichunks) > 1:
         try:
             if not quiet:
                 print 'Concat all chunks'
@@ -598,6 +841,10 @@ def read_chunked(run=None, path=None, exp=None, dim='time',
                 except:
                     print 'Cleanup failed:  Could not delete files {:}'.format(files)
                     traceback.print_exc()
+                
+                if chunks is not None:
+                    # lazy data from deleted chunk files is now in the run file 
+                    x = xr.open_dataset(save_file, engine=engine, chunks=chunks)
         except:
             print 'Write Failed to {:}'.format(save_file)
             traceback.print_exc()
@@ -605,11 +852,86 @@ def read_chunked(run=None, path=None, exp=None, dim='time',
 
     return x
 
+def _assemble_virtual(run, path, chunks, merge=False, make_cuts=True, 
+        save=True, save_path=None, cleanup=True, engine='h5netcdf', quiet=False):
+    """
+    Assemble run file from merged chunk files with hdf5 virtual datasets.
+    See read_chunked.
+    """
+    import xarray as xr
+    import glob
+    file_base = 'run{:04}'.format(run)
+    chunk_files = []
+    for chunk in sorted(chunks):
+        file_name = '{:}//{:}_C{:02}.nc'.format(path,file_base,chunk)
+        if merge or not os.path.isfile(file_name):
+            if not quiet:
+                print 'Merging chunk', chunk
+            file_name = merge_chunk(path, file_base, chunk, engine=engine, quiet=quiet)
+        
+        if file_name:
+            chunk_files.append(file_name)
+
+    if isinstance(save, str):
+        save_file = save
+    else:
+        if not save_path:
+            save_path = os.path.dirname(os.path.dirname(path))
+        save_file = '{:}//{:}.nc'.format(save_path,file_base)
+    
+    if not quiet:
+        print 'Writing virtual Run {:} to {:}'.format(run, save_file) 
+    
+    write_virtual_run(chunk_files, save_file)
+
+    print '... merge stats chunks', run, path
+    try:
+        xstats = merge_stats(run=run, path=path, engine=engine)
+        if xstats is not None:
+            xstats.to_netcdf(save_file, mode='a', engine=engine)
+    except:
+        traceback.print_exc()
+        print 'Cannot merge stats chunks'
+        cleanup = False
+
+    if cleanup:
+        # keep merged chunk files used by virtual datasets
+        files = [f for f in glob.glob('{:}/{:}_C*_*.nc'.format(path, file_base)) \
+                    if f not in chunk_files]
+        try:
+            for f in files:
+                os.remove(f)
+        except:
+            print 'Cleanup failed:  Could not delete files {:}'.format(files)
+            traceback.print_exc()
+
+    x = xr.open_dataset(save_file, engine=engine)
+    try: 
+        x = x.set_coords([a for a in x.data_vars if a.endswith('present')]) 
+    except:
+        pass
+    
+    if make_cuts:
+        try:
+            x = make_default_cuts(x)
+        except:
+            traceback.print_exc()
+            print 'Cannot make default cuts'
+
+    return x
+
 def to_hdf5_mpi(self, build_html='basic', 
             default_stats=False,
-            save=True, cleanup=True, **kwargs):
+            save=True, cleanup=True, 
+            merge_chunks=True, **kwargs):
     """
     MPI wrapper for write_hdf5
+
+    Parameters
+    ----------
+    merge_chunks : bool
+        If true each rank merges the detector files of its own chunk 
+        so that rank 0 only needs to concatenate the merged chunks [default=True]
     """
     import time
     time0 = time.time()
@@ -630,7 +952,18 @@ def to_hdf5_mpi(self, build_html='basic',
     self.reset_stats()
 
     print 'Rank', rank, ', mpi time', time.time()-time0
-    
+   
+    if merge_chunks:
+        ichunk = kwargs.get('ichunk')
+        if ichunk is None:
+            ichunk = rank
+        try:
+            merge_chunk(path, file_base, ichunk)
+            print 'Rank', rank, ', merged chunk', ichunk, time.time()-time0
+        except:
+            traceback.print_exc()
+            print 'Rank', rank, ', could not merge chunk', ichunk
+
     files = comm.gather(file_base)
 
     if rank == 0:
@@ -733,6 +1066,179 @@ def get_config_xarray(ds=None, exp=None, run=None, path=None, file_name=None,
 
     return x
 
+# hdf5 storage profiles for write_hdf5 variables.  
+# All profiles chunk variables along the time axis.
+#   narrow : use the data type in the detector _xarray_info dtypes instead of float
+#   other items are passed to h5netcdf create_variable (i.e., h5py create_dataset)
+storage_profiles = {
+        'chunked': {'narrow': False},
+        'native':  {'narrow': True},
+        'lzf':     {'narrow': True, 'compression': 'lzf', 'shuffle': True},
+        'gzip':    {'narrow': True, 'compression': 'gzip', 'compression_opts': 4, 
+                    'shuffle': True},
+        }
+
+def get_storage_kwargs(storage_profile, shape, dtype=float, block_size=100, chunk_bytes=2**20):
+    """
+    Keywords for h5netcdf create_variable from a storage profile.
+
+    Parameters
+    ----------
+    storage_profile : str or dict
+        Name of profile in storage_profiles or dict of profile items
+    shape : tuple
+        Shape of variable with time as first dimension
+    dtype : type
+        Data type of variable
+    block_size : int
+        Maximum number of events in a chunk (i.e., write_hdf5 block_size)
+    chunk_bytes : int
+        Maximum size of a chunk unless one event is larger
+    """
+    if not storage_profile:
+        return {}
+
+    if isinstance(storage_profile, dict):
+        profile = storage_profile
+    elif storage_profile in storage_profiles:
+        profile = storage_profiles[storage_profile]
+    else:
+        raise Exception('storage_profile must be one of {:}'.format(storage_profiles.keys()))
+
+    shape = tuple(shape)
+    if not shape or 0 in shape:
+        return {}
+
+    kwargs = {attr: item for attr, item in profile.items() if attr != 'narrow'}
+    row_bytes = int(np.prod(shape[1:]))*np.dtype(dtype).itemsize
+    ntime = int(max(1, min(shape[0], block_size, chunk_bytes // max(row_bytes, 1))))
+    kwargs['chunks'] = (ntime,)+shape[1:]
+    return kwargs
+
+class BlockWriter(object):
+    """
+    Write-behind buffer for time dependent variables of an h5netcdf File.
+
+    Event values are collected in preallocated numpy arrays and written 
+    with one hyperslab write per variable for each block of events 
+    instead of one small hdf5 write per event and variable.
+    Rows that are not set keep the fill value of the variable.
+
+    Parameters
+    ----------
+    h5file : h5netcdf.File
+        File with variables that have 'time' as the first dimension
+    variables : list
+        Names of variables to buffer
+    block_size : int
+        Number of events buffered before writing to file
+    max_bytes : int
+        Maximum size of buffers.  The number of events in a block is reduced
+        for large data (e.g., full area detector images).
+
+    Example
+    -------
+    xbuf = BlockWriter(xbase, ['sec', 'nsec'], block_size=100)
+    irow = xbuf.row(iwrite)
+    xbuf['sec'][irow] = dtime.sec
+    xbuf.flush()
+
+    """
+    def __init__(self, h5file, variables=[], block_size=100, max_bytes=2**26):
+        self._file = h5file
+        self.block_size = int(block_size)
+        self.max_bytes = max_bytes
+        self._buffers = {}
+        self._stacks = {}
+        self._data = {}
+        self._nblock = 0
+        self._iwrite0 = None
+        self._nrows = 0
+        for name in variables:
+            self.add_variable(name)
+
+    def _add_buffer(self, name, shape, dtype, fill=0):
+        # buffers are (re)allocated on the next row
+        self.flush()
+        self._buffers[name] = (tuple(shape), np.dtype(dtype), fill)
+        self._data = {}
+
+    def add_variable(self, name):
+        """
+        Add a variable of the file to the buffer.
+        """
+        var = self._file[name]
+        self._add_buffer(name, var.shape[1:], var.dtype, var.attrs.get('_FillValue', 0))
+
+    def add_stack(self, name, variables, dtype=bool):
+        """
+        Buffer several 1-d variables as the columns of one 2-d buffer, e.g., 
+        event code flags so that all codes of an event can be set at once.
+        """
+        self._stacks[name] = list(variables)
+        self._add_buffer(name, (len(variables),), dtype)
+
+    @property
+    def nblock(self):
+        """
+        Number of events per block limited by max_bytes.
+        """
+        row_bytes = sum(int(np.prod(shape))*dtype.itemsize \
+                        for shape, dtype, fill in self._buffers.values())
+        if row_bytes:
+            return int(max(1, min(self.block_size, self.max_bytes // row_bytes)))
+        else:
+            return self.block_size
+
+    def _allocate(self):
+        self._nblock = self.nblock
+        for name, (shape, dtype, fill) in self._buffers.items():
+            self._data[name] = np.full((self._nblock,)+shape, fill, dtype=dtype)
+
+    def row(self, iwrite):
+        """
+        Start buffering event with file index iwrite and return the buffer row.
+        Buffered events are written first if the buffer is full or 
+        iwrite does not follow the last buffered event.
+        """
+        if self._iwrite0 is not None:
+            if self._nrows == self._nblock or iwrite != self._iwrite0+self._nrows:
+                self.flush()
+
+        if not self._data:
+            self._allocate()
+
+        if self._iwrite0 is None:
+            self._iwrite0 = iwrite
+
+        irow = self._nrows
+        self._nrows += 1
+        return irow
+
+    def flush(self):
+        """
+        Write buffered events to file and reset buffer.
+        """
+        if self._nrows and self._data:
+            islice = slice(self._iwrite0, self._iwrite0+self._nrows)
+            for name, data in self._data.items():
+                if name in self._stacks:
+                    for i, attr in enumerate(self._stacks[name]):
+                        self._file[attr][islice] = data[:self._nrows,i]
+                else:
+                    self._file[name][islice] = data[:self._nrows]
+                
+                data[:self._nrows] = self._buffers[name][2]
+
+        self._iwrite0 = None
+        self._nrows = 0
+
+    def __getitem__(self, name):
+        return self._data[name]
+
+    def __contains__(self, name):
+        return name in self._buffers
+
 # Need to add in 'chunking based on steps'
 def write_hdf5(self, nevents=None, max_size=10001, 
         aliases={},
@@ -757,6 +1263,8 @@ def write_hdf5(self, nevents=None, max_size=10001,
         min_all_save=10,
         auto_update=True,
         auto_pvs=True,
+        block_size=100,
+        storage_profile=None,
         **kwargs):
     """
     Write directly to hdf5 with h5netcdf package.  
@@ -766,7 +1274,7 @@ def write_hdf5(self, nevents=None, max_size=10001,
     max_size : uint
         Maximum array size of data objects to build into xarray.
     ichunk: int
-        chunk index (skip ahead nevents*ichunk)
+        chunk index (jump ahead nevents*ichunk using the run idx times)
     pvs: list
         List of pvs to be loaded vs time
     epics_attrs: list
@@ -789,6 +1297,12 @@ def write_hdf5(self, nevents=None, max_size=10001,
         If true automatically update xarray info for all detectors
     auto_pvs : bool
         If true automatically add pvs that were moved during run.
+    block_size : int
+        Number of events buffered in memory before writing to file [default=100]
+        and maximum number of events in hdf5 chunks
+    storage_profile : str or dict
+        hdf5 storage profile in storage_profiles (e.g., 'chunked', 'native', 'lzf', 'gzip'). 
+        Default None stores float data without chunks or compression.
 
     Example
     -------
@@ -904,6 +1418,14 @@ def write_hdf5(self, nevents=None, max_size=10001,
     xbase.dimensions['time'] = ntime
     #xbase = h5netcdf.File(file_name, 'w', invalid_netcdf=True)
 
+    def storage_kwargs(shape, dtype=float):
+        return get_storage_kwargs(storage_profile, shape, dtype, block_size=block_size)
+    
+    if isinstance(storage_profile, dict):
+        narrow_dtypes = storage_profile.get('narrow')
+    else:
+        narrow_dtypes = storage_profiles.get(storage_profile, {}).get('narrow')
+
     neventCodes = len(eventCodes)
 
 
@@ -926,7 +1448,7 @@ def write_hdf5(self, nevents=None, max_size=10001,
     cattrs =  ['sec', 'nsec', 'fiducials', 'ticks', 'run', 'step']
 
     for attr in cattrs:
-        xcoords[attr] = xbase.create_variable(attr, ('time',), int)
+        xcoords[attr] = xbase.create_variable(attr, ('time',), int, **storage_kwargs((ntime,), int))
 
     coordinates = ' '.join(cattrs)
 
@@ -934,17 +1456,18 @@ def write_hdf5(self, nevents=None, max_size=10001,
     #if not no_events:
     for code in eventCodes:
         attr = 'ec{:}'.format(code)
-        xbase.create_variable(attr, ('time',), bool)
+        xbase.create_variable(attr, ('time',), bool, **storage_kwargs((ntime,), bool))
         xbase[attr].attrs['doc'] = 'Event Code present for {:}'.format(attr)
         coordinates += ' {:}'.format(attr)
 
     for attr, ec in code_flags.items():
-        xbase.create_variable(attr, ('time',), bool)
+        xbase.create_variable(attr, ('time',), bool, **storage_kwargs((ntime,), bool))
         xbase[attr].attrs['doc'] = 'Event code flag: True if all positive and no negative "codes" are in eventCodes'
         xbase[attr].attrs['codes'] = ec
         coordinates += ' {:}'.format(attr)
 
-    xbase.attrs['event_flags'] = code_flags.keys()
+    event_flags = code_flags.keys()
+    xbase.attrs['event_flags'] = event_flags
    
     # eventCode Timestamp information
     xbase.dimensions['eventCodes'] = len(eventCodes)
@@ -952,13 +1475,24 @@ def write_hdf5(self, nevents=None, max_size=10001,
     xbase['eventCodes'][:] = eventCodes
     xbase['eventCodes'].attrs['doc'] = 'Event Codes'
     attr = 'timestampHigh'
-    xbase.create_variable(attr, ('time','eventCodes',), int)
+    xbase.create_variable(attr, ('time','eventCodes',), int, 
+            **storage_kwargs((ntime, len(eventCodes)), int))
     xbase[attr].attrs['doc'] = 'Timestamp High Value for eventCodes'
     coordinates += ' {:}'.format(attr)
     attr = 'timestampLow'
-    xbase.create_variable(attr, ('time','eventCodes',), int)
+    xbase.create_variable(attr, ('time','eventCodes',), int, 
+            **storage_kwargs((ntime, len(eventCodes)), int))
     xbase[attr].attrs['doc'] = 'Timestamp Low Value for eventCodes'
     coordinates += ' {:}'.format(attr)
+    
+    # Buffer event coordinates and Evr data and write in blocks of events
+    aeventCodes = np.array(eventCodes)
+    # index of eventCodes in the Evr code arrays for codes 0-255 (see PyDataSource.EvrEventCodes)
+    valid_codes = (aeventCodes >= 0) & (aeventCodes < 256)
+    icodes = np.where(valid_codes, aeventCodes, 0).astype(int)
+    xbuf = BlockWriter(xbase, cattrs+['timestampHigh', 'timestampLow'], block_size=block_size)
+    xbuf.add_stack('eventCodes', ['ec{:}'.format(code) for code in eventCodes])
+    xbuf.add_stack('event_flags', event_flags)
    
     # add epics pvs expected to change during run
    
@@ -1076,6 +1610,7 @@ def write_hdf5(self, nevents=None, max_size=10001,
             axcoords[det] = {}
             #det_funcs[det] = {}
             xarray_dims = detector._xarray_info.get('dims')
+            xarray_dtypes = detector._xarray_info.get('dtypes', {})
             axfuncs[det] = [] 
             # Add default attr information.
             src_info.update(**detector._source_info)
@@ -1104,7 +1639,7 @@ def write_hdf5(self, nevents=None, max_size=10001,
             
             attr = 'present'
             alias = det+'_'+attr
-            xbase.create_variable(alias, ('time',), bool)
+            xbase.create_variable(alias, ('time',), bool, **storage_kwargs((ntime,), bool))
             xbase[alias].attrs.update(**config_info)
             xbase[alias].attrs.update(**src_info)
 #            xbase[alias].attrs['funcs'] = funcs
@@ -1177,7 +1712,12 @@ def write_hdf5(self, nevents=None, max_size=10001,
                                     print 'coord', det, name, xshape, alias, a
                                     axdat[det].dimensions[xname] = xshape
 
-                            adat[det][alias] = axdat[det].create_variable(alias, a, float)
+                            if narrow_dtypes and xarray_dtypes.get(attr):
+                                dtype = np.dtype(xarray_dtypes.get(attr))
+                            else:
+                                dtype = float
+                            adat[det][alias] = axdat[det].create_variable(alias, a, dtype,
+                                                        **storage_kwargs(b, dtype))
                             axfuncs[det].append(attr)
                             try:
                                 axdat[det][alias].attrs.update(**attr_info)
@@ -1188,7 +1728,7 @@ def write_hdf5(self, nevents=None, max_size=10001,
             coordinates = ' '.join(['sec', 'nsec', 'fiducials', 'ticks', 'run', 'step'])
             if not no_events:
                 for attr in ['sec', 'nsec', 'fiducials', 'ticks', 'run', 'step']:
-                    axdat[det].create_variable(attr, ('time',), int)
+                    axdat[det].create_variable(attr, ('time',), int, **storage_kwargs((ntime,), int))
         
             coords = detector._xarray_info.get('coords')
             if coords:
@@ -1258,23 +1798,40 @@ def write_hdf5(self, nevents=None, max_size=10001,
         aievents = {}
         asteps = [] 
 
+        # Jump directly to each event of the chunk with the run idx times 
+        # instead of replaying all events before the chunk start.
+        seek_events = ichunk > 0 and not chunk_steps \
+                and getattr(self, '_idx_times', None) is not None
+
         # keep track of events for each det
         for srcstr, srcitem in self.configData._sources.items():
             det0 = srcitem.get('alias')
             det = aliases.get(det0, det0)
             aievt[det] = -1
             aievents[det] = []
+            if det+'_present' in xbase:
+                xbuf.add_variable(det+'_present')
+
+        # Buffer detector data and write in blocks of events
+        axbuf = {}
+        for det in axdat:
+            axbuf[det] = BlockWriter(axdat[det], 
+                    [attr for attr in cattrs if attr in axdat[det]], block_size=block_size)
+            for attr in axfuncs[det]:
+                axbuf[det].add_variable(det+'_'+attr)
       
         if ichunk is not None:
             #print 'Making chunk {:}'.format(ichunk)
             #print 'Starting with event {:} of {:}'.format(ievent0,self.nevents)
             #print 'Analyzing {:} events'.format(nevents)
             xbase.attrs['ichunk'] = ichunk
-            # Need to update to jump to event.
             if ichunk > 0 and not chunk_steps:
-                print 'skipping ahead to event {:} for chunk {:}'.format(ievent0,ichunk)
-                for i in range(ievent0):
-                    evt = self.events.next()
+                if seek_events:
+                    print 'jumping to event {:} for chunk {:}'.format(ievent0,ichunk)
+                else:
+                    print 'skipping ahead to event {:} for chunk {:}'.format(ievent0,ichunk)
+                    for i in range(ievent0):
+                        evt = self.events.next()
                 
                 print('reset_stats ...', ichunk)
                 self.reset_stats()
@@ -1314,7 +1871,10 @@ def write_hdf5(self, nevents=None, max_size=10001,
             elif ievent < self.nevents:
                 try:
                     #evt = self.events.next(publish=publish, init=publish)
-                    evt = self.events.next(publish=publish)
+                    if seek_events:
+                        evt = self.events.next(evt_time=ievent, publish=publish)
+                    else:
+                        evt = self.events.next(publish=publish)
                 except:
                     ievent = -1
                     continue
@@ -1340,32 +1900,23 @@ def write_hdf5(self, nevents=None, max_size=10001,
 
             istep = self._istep
             asteps.append(istep)
-            xbase['step'][iwrite] = istep
-            xbase['run'][iwrite] = run
+            irow = xbuf.row(iwrite)
+            xbuf['step'][irow] = istep
+            xbuf['run'][irow] = run
             #btimes.append(dtime)
             
             for attr in ['sec', 'nsec', 'fiducials', 'ticks']:
-                xbase[attr][iwrite] = getattr(dtime, attr)
-            
-            #for ec in evt.Evr.eventCodes:
-            #for iec, ec in enumerate(evt.Evr.fifoEvents.eventCode):
-            for iec, ec in enumerate(evt.Evr.eventCodes_strict):
-                if ec in eventCodes:
-                    xbase['ec{:}'.format(ec)][iwrite] = True 
-
-            xbase['timestampLow'][iwrite] = [evt.Evr.timestampLow.get(ec,0) for ec in eventCodes]
-            xbase['timestampHigh'][iwrite] = [evt.Evr.timestampHigh.get(ec,0) for ec in eventCodes]
-#            fevr = evt.Evr.fifoEvents
-#            thigh = dict(zip(fevr.eventCode, fevr.timestampHigh))
-#            tshigh = [thigh.get(ec,0) for ec in eventCodes]
-#            tlow = dict(zip(fevr.eventCode, fevr.timestampLow))
-#            tslow = [tlow.get(ec,0) for ec in eventCodes]
-#            xbase['timestampLow'][iwrite] = tslow
-#            xbase['timestampHigh'][iwrite] = tshigh
+                xbuf[attr][irow] = getattr(dtime, attr)
             
-            for attr, codes in code_flags.items():
-                if evt.Evr.present(codes):
-                    xbase[attr][iwrite] = True
+            # Evr data for all eventCodes is buffered and written in blocks
+            evr = evt.Evr
+            evr_codes = evr._codes
+            xbuf['eventCodes'][irow] = evr_codes.bits_strict[icodes] & valid_codes
+            xbuf['timestampLow'][irow] = np.where(valid_codes, evr_codes.timestampLow_codes[icodes], 0)
+            xbuf['timestampHigh'][irow] = np.where(valid_codes, evr_codes.timestampHigh_codes[icodes], 0)
+            for iflag, attr in enumerate(event_flags):
+                if evr.present(code_flags[attr]):
+                    xbuf['event_flags'][irow,iflag] = True
 
             # put pvControls step value for each event 
             for pv, xpv in apvControls.items():
@@ -1383,8 +1934,8 @@ def write_hdf5(self, nevents=None, max_size=10001,
 
             for det0 in evt._attrs:
                 det = aliases.get(det0, det0)
-                if det+'_present' in xbase:
-                    xbase[det+'_present'][iwrite] = True
+                if det+'_present' in xbuf:
+                    xbuf[det+'_present'][irow] = True
             
             if not no_events:
                 for det0 in evt._attrs:
@@ -1407,8 +1958,9 @@ def write_hdf5(self, nevents=None, max_size=10001,
                         print '********'
                         print '********'
                     try:
+                        irow = axbuf[det].row(iwrite)
                         for attr in ['sec', 'nsec', 'fiducials', 'ticks']:
-                            axdat[det][attr][iwrite] = getattr(dtime, attr)
+                            axbuf[det][attr][irow] = getattr(dtime, attr)
                     except:
                         traceback.print_exc()
                         print 'Bad time'
@@ -1418,8 +1970,8 @@ def write_hdf5(self, nevents=None, max_size=10001,
                         print axdat[det][attr]
                         continue
 
-                    axdat[det]['step'][iwrite] = istep
-                    axdat[det]['run'][iwrite] = run
+                    axbuf[det]['step'][irow] = istep
+                    axbuf[det]['run'][irow] = run
                     for attr in  axfuncs[det]:
                         try:
                             vals = getattr(detector, attr)
@@ -1428,7 +1980,7 @@ def write_hdf5(self, nevents=None, max_size=10001,
                                 try:
                                     if debug:
                                         print det, attr, vals
-                                    axdat[det][alias][iwrite] = vals
+                                    axbuf[det][alias][irow] = vals
                                 except:
                                     if debug:
                                         traceback.print_exc()
@@ -1439,9 +1991,11 @@ def write_hdf5(self, nevents=None, max_size=10001,
                                 traceback.print_exc()
                                 print 'Event Error', alias, det, attr, ievent
 
+        xbuf.flush()
         print self.stats
         xbase.attrs['nevents'] = igood+1
         for det in axdat:
+            axbuf[det].flush()
             axdat[det].attrs['nevents'] = aievt[det]+1
             axdat[det].close()
 
@@ -3,6 +3,7 @@ import os
 
 from pylab import *
 from scipy import signal
+from qadc import filter_waveforms
 
 class Impbox(PyDataSource.Detector):
     """Imp waveform sampling module filters each of the four waveforms.
@@ -27,6 +28,11 @@ class Impbox(PyDataSource.Detector):
         self.add.property(filtered)
 #        self._update_xarray_info()
 
+    def _get_filtered(self, attr=None):
+        """Filtered waveforms of all channels (see qadc.filter_waveforms).
+        """
+        return filter_waveforms(np.asarray(self.waveform)[:self.nchannels], self.filter)
+
     def _update_xarray_info(self):
 
         nchannels = self.nchannels
@@ -69,11 +75,9 @@ class Channel(object):
     
     @property
     def filtered(self):
-        hw = len(self.filter)/2
-        f = -signal.convolve(self.waveform,self.filter)
-        f[0:len(self.filter)+1] = 0
-        f[-len(self.filter)-1:] = 0
-        return f[hw:self.waveform.size+hw]
+        """Filtered waveform of channel (filtered with all channels once per event).
+        """
+        return filtered(self._imp)[self._channel]
 
     @property
     def time(self):
@@ -107,11 +111,11 @@ class Channel(object):
 def amplitudes(self):
     """Amplitude of each filtered waveform.
     """
-    return [getattr(self, 'Ch'+str(ch+1)).amplitude for ch in range(self.nchannels)]
+    return list(filtered(self).max(axis=1))
     
 def filtered(self):
     """Amplitude of each filtered waveform.
-    """
-    return np.array([getattr(self, 'Ch'+str(ch+1)).filtered for ch in range(self.nchannels)])
-    
 
+    Filtered once per event and shared by the Channel amplitude, time and peak.
+    """
+    return self._get_cached(self._get_filtered, 'filtered')
@@ -24,6 +24,11 @@ class Qadc(PyDataSource.Detector):
         self.add.property(filtered)
 #        self._update_xarray_info()
 
+    def _get_filtered(self, attr=None):
+        """Filtered waveforms of all channels (see filter_waveforms).
+        """
+        return filter_waveforms(np.asarray(self.evtData.data_u16)[:self.nchannels], self.filter)
+
     def _update_xarray_info(self):
 
         nchannels = self.nchannels
@@ -66,12 +71,9 @@ class Channel(object):
     
     @property
     def filtered(self):
-        from scipy import signal
-        hw = len(self.filter)/2
-        f = -signal.convolve(self.waveform,self.filter)
-        f[0:len(self.filter)+1] = 0
-        f[-len(self.filter)-1:] = 0
-        return f[hw:self.waveform.size+hw]
+        """Filtered waveform of channel (filtered with all channels once per event).
+        """
+        return filtered(self._qadc)[self._channel]
 
     @property
     def time(self):
@@ -98,11 +100,35 @@ class Channel(object):
 def amplitudes(self):
     """Amplitude of each filtered waveform.
     """
-    return [getattr(self, 'Ch'+str(ch+1)).amplitude for ch in range(self.nchannels)]
+    return list(filtered(self).max(axis=1))
     
 def filtered(self):
     """Amplitude of each filtered waveform.
-    """
-    return np.array([getattr(self, 'Ch'+str(ch+1)).filtered for ch in range(self.nchannels)])
     
-
+    Filtered once per event and shared by the Channel amplitude, time and peak.
+    """
+    return self._get_cached(self._get_filtered, 'filtered')
+
+def filter_waveforms(wfs, filter):
+    """Filter waveforms of all channels with one 2D convolution.
+
+    Parameters
+    ----------
+    wfs : array
+        Waveforms with shape (nchannels, nsamples)
+    filter : array
+        Filter applied along the samples of each channel
+
+    Returns
+    -------
+    Negative filtered waveforms with the same shape as wfs, 
+    set to zero within the filter length of each end.
+    """
+    from scipy import signal
+    wfs = np.asarray(wfs)
+    nfilter = len(filter)
+    hw = nfilter//2
+    f = -signal.convolve(wfs, np.asarray(filter)[np.newaxis,:])
+    f[:,0:nfilter+1] = 0
+    f[:,-nfilter-1:] = 0
+    return f[:,hw:wfs.shape[1]+hw]
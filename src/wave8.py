@@ -22,6 +22,27 @@ class Wave8(PyDataSource.Detector):
         bkrange = kwargs.get('bkrange', [500,600])
         self.add.parameter(bkrange=bkrange)
 
+    def _get_waveforms(self, attr=None):
+        """Background subtracted waveforms of all channels.
+        """
+        nchannels = self.nchannels
+        data = self.evtData.data_u32
+        data16 = None
+        wfs = None
+        for ch in range(nchannels):
+            wf = data[ch]
+            if len(wf) == 0:
+                if data16 is None:
+                    data16 = self.evtData.data_u16
+                wf = data16[ch]
+            if wfs is None:
+                wfs = np.empty((nchannels, len(wf)))
+            wfs[ch] = wf
+        
+        back = wfs[:, self.bkrange[0]:self.bkrange[1]].mean(axis=1)
+        np.subtract(back[:, np.newaxis], wfs, out=wfs)
+        return wfs
+
     def _update_xarray_info(self):
 
         nchannels = self.nchannels
@@ -47,24 +68,16 @@ class Wave8(PyDataSource.Detector):
 def peaks(self):
     """Max value of each waveform.
     """
-    return np.array([max(self.waveforms[ch]) for ch in range(self.nchannels)])
+    return waveforms(self).max(axis=1)
 
 def count(self):
     """Sum of first four waveform peaks [ADU]
     """
-    return sum(self.peaks[0:3])
+    return peaks(self)[0:3].sum()
 
 def waveforms(self):
     """Array of 8 waveforms with background subtration from mean within self.bkrange.
-    """
-    wfs = []
-    for ch in range(self.nchannels):
-        wf = self.evtData.data_u32[ch]
-        if len(wf) == 0:
-            wf = self.evtData.data_u16[ch]
-        back = wf[self.bkrange[0]:self.bkrange[1]].mean()
-        wfs.append(-1.*wf+back)
-
-    return np.array(wfs)
-
 
+    Made once per event and shared by peaks and count (do not modify in place).
+    """
+    return self._get_cached(self._get_waveforms, 'waveforms')
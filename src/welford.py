@@ -1,61 +1,320 @@
 import numpy as np
 
+def _combine(na, meana, M2a, nb, meanb, M2b):
+    """Combine count, mean and sum of squared deviations (M2) of two samples.
+
+       Parallel algorithm of Chan et al. -- exact and associative, so
+       accumulators from any number of chunks give the same result as one pass.
+    """
+    n = na + nb
+    with np.errstate(divide='ignore', invalid='ignore'):
+        fb = np.where(n > 0, nb / n, 0.)
+
+    delta = meanb - meana
+    mean = meana + delta * fb
+    M2 = M2a + M2b + delta * delta * na * fb
+    return n, mean, M2
+
+def merge_moments(na, meana, vara, nb, meanb, varb):
+    """
+    Exact pooled count, mean and variance of two samples.
+
+    Parameters
+    ----------
+    na, nb : array_like
+        Number of entries in each sample (must broadcast with the means)
+    meana, meanb : array_like
+        Mean of each sample
+    vara, varb : array_like
+        Variance of each sample (normalized by n-1 as in Welford.var)
+
+    Returns
+    -------
+    n, mean, var
+    """
+    na = np.asarray(na, dtype=np.float64)
+    nb = np.asarray(nb, dtype=np.float64)
+    meana = np.where(na > 0, meana, 0.)
+    meanb = np.where(nb > 0, meanb, 0.)
+    M2a = np.where(na > 1, vara, 0.) * np.maximum(na - 1., 0.)
+    M2b = np.where(nb > 1, varb, 0.) * np.maximum(nb - 1., 0.)
+    n, mean, M2 = _combine(na, meana, M2a, nb, meanb, M2b)
+    var = np.where(n > 1, M2 / np.maximum(n - 1., 1.), 0.)
+    return n, mean, var
+
+
+def _inplace(func, a, b):
+    """Apply ufunc func to a and b storing the result in a if the dtypes allow.
+    """
+    try:
+        return func(a, b, out=a)
+    except TypeError:
+        return func(a, b)
+
+
 class Welford(object):
-    """Knuth implementation of Welford algorithm.
+    """Welford algorithm for running mean and variance.
+
+    Keeps the count, mean, sum of squared deviations (M2), min and max
+    so that accumulators can be merged exactly (see merge).
+    Buffers are allocated with the first data and updated in place.
+
+    Parameters
+    ----------
+    x : array_like, optional
+        First data to add
+    block_size : int, optional
+        If > 1 stage up to block_size entries in a preallocated buffer
+        and add them together with add_block.  Staged data is added 
+        before any result is returned.
+    dtype : numpy dtype, optional
+        Storage type of the mean and M2 [default = float64].
+        For lower precision types (e.g., float32) the updates use 
+        compensated (Kahan) summation.
+    minmax : bool
+        Keep min and max [default = True].  If False min and max return None.
     """
 
-    def __init__(self, x=None):
-        self._K = np.float64(0.) 
-        self.n = np.float64(0.)
-        self._Ex = np.float64(0.)
-        self._Ex2 = np.float64(0.)
+    def __init__(self, x=None, block_size=None, dtype=None, minmax=True):
+        self._n = np.float64(0.)
+        self._mean = np.float64(0.)
+        self._M2 = np.float64(0.)
+        self._comp = {}
         self.shape = None
         self._min = None
         self._max = None
         self._init = False
+        self.block_size = block_size
+        self.dtype = np.dtype(dtype or np.float64)
+        self.minmax = minmax
+        self._block = None
+        self._nblock = 0
         self.__call__(x)
-         
+
+    @property
+    def n(self):
+        """
+        Number of entries.
+        """
+        self.flush()
+        return self._n
+
+    @classmethod
+    def from_stats(cls, n, mean, var, min=None, max=None, **kwargs):
+        """
+        Make Welford object from saved count, mean, variance and
+        optionally min and max.
+        """
+        self = cls(**kwargs)
+        n = np.float64(n)
+        if n <= 0:
+            return self
+
+        mean = np.asarray(mean)
+        self._allocate(mean.shape)
+        self._n = n
+        self._mean[...] = mean
+        self._M2[...] = np.asarray(var) * (n - 1.)
+        if self.minmax:
+            if min is not None:
+                self._min = np.array(min)
+            if max is not None:
+                self._max = np.array(max)
+
+        return self
+
+    def _allocate(self, shape):
+        """Allocate mean and M2 (and compensation) buffers.
+        """
+        self._init = True
+        self.shape = shape
+        self._mean = np.zeros(shape, dtype=self.dtype)
+        self._M2 = np.zeros(shape, dtype=self.dtype)
+        self._comp = {}
+        if self.dtype.itemsize < 8:
+            self._comp = {'_mean': np.zeros(shape, dtype=self.dtype), 
+                          '_M2': np.zeros(shape, dtype=self.dtype)}
+
+    def _accumulate(self, attr, inc):
+        """Add inc to buffer attr in place (compensated for low precision storage).
+        """
+        val = getattr(self, attr)
+        comp = self._comp.get(attr)
+        if comp is None:
+            val += inc
+        else:
+            y = np.subtract(inc, comp, dtype=self.dtype)
+            t = val + y
+            comp[...] = (t - val) - y
+            val[...] = t
+
+    def _value(self, attr):
+        """Buffer attr in float64 including any compensation.
+        """
+        val = getattr(self, attr)
+        comp = self._comp.get(attr)
+        if comp is None:
+            return np.array(val, dtype=np.float64)
+        else:
+            return val.astype(np.float64) - comp
+
+    def _update_minmax(self, xmin, xmax):
+        """Update min and max in place.
+        """
+        if not self.minmax:
+            return
+        
+        if self._min is None:
+            self._min = np.array(xmin)
+            self._max = np.array(xmax)
+        else:
+            self._min = _inplace(np.minimum, self._min, xmin)
+            self._max = _inplace(np.maximum, self._max, xmax)
+
     def add_data(self, x):
         """Add data.
         """
         if x is None:
             return
         
-        x = np.array(x)
-        self.n += 1.
+        if self.block_size and self.block_size > 1:
+            self._stage(x)
+            return
+
+        x = np.asarray(x)
         if not self._init:
-            self._init = True
-            self._K = x
-            self._min = x
-            self._max = x
-            self.shape = x.shape
-        else:
-            self._min = np.minimum(self._min, x)
-            self._max = np.maximum(self._max, x)
+            self._allocate(x.shape)
         
-        self._Ex += (x - self._K) / self.n
-        self._Ex2 += (x - self._K) * (x - self._Ex)
-        self._K = self._Ex
-    
+        self._update_minmax(x, x)
+        self._merge_moments(np.float64(1.), x, 0.)
+
+    def _stage(self, x):
+        """Copy data into the block buffer and add the block when full.
+        """
+        x = np.asarray(x)
+        if self._block is None:
+            # float64 so that later float data is not truncated to the first data type
+            self._block = np.empty((self.block_size,)+x.shape, dtype=np.float64)
+            if self.shape is None:
+                self.shape = x.shape
+        
+        self._block[self._nblock] = x
+        self._nblock += 1
+        if self._nblock == self.block_size:
+            self.flush()
+
+    def flush(self, release=False):
+        """
+        Add any staged data.
+
+        Parameters
+        ----------
+        release : bool
+            Free the block buffer (reallocated when more data is added).
+        """
+        if self._nblock:
+            nblock = self._nblock
+            self._nblock = 0
+            self.add_block(self._block[:nblock])
+        
+        if release:
+            self._block = None
+
+    def add_block(self, x):
+        """
+        Add a block of data stacked along the first axis (e.g., K frames).
+
+        The block mean and sum of squared deviations are computed with
+        array operations and merged with the running values in place.
+        """
+        if x is None:
+            return
+
+        x = np.asarray(x)
+        nb = x.shape[0]
+        if not nb:
+            return
+
+        if not self._init:
+            self._allocate(x.shape[1:])
+        
+        meanb = x.mean(axis=0, dtype=np.float64)
+        dev = np.subtract(x, meanb, dtype=np.float64)
+        dev *= dev
+        M2b = dev.sum(axis=0)
+        del dev
+        if self.minmax:
+            self._update_minmax(x.min(axis=0), x.max(axis=0))
+        self._merge_moments(np.float64(nb), meanb, M2b)
+
+    def _merge_moments(self, nb, meanb, M2b):
+        """In place version of _combine for allocated accumulators.
+        """
+        n = self._n + nb
+        if self._comp:
+            delta = np.subtract(meanb, self._value('_mean'))
+        else:
+            delta = np.subtract(meanb, self._mean, dtype=np.float64)
+        self._accumulate('_mean', delta * (nb / n))
+        delta *= delta
+        delta *= self._n * nb / n
+        delta += M2b
+        self._accumulate('_M2', delta)
+        self._n = n
+
     def __call__(self, x):
         self.add_data(x)
 
+    def merge(self, other):
+        """
+        Merge accumulated data from another Welford object into this one.
+
+        The result is the same as if all data had been added to one object,
+        independent of how the data was split.
+        """
+        if other is None:
+            return self
+
+        self.flush()
+        other.flush()
+        if not other._init:
+            return self
+
+        if not self._init:
+            self._allocate(other.shape)
+        
+        if other._min is not None:
+            self._update_minmax(other._min, other._max)
+        self._merge_moments(other._n, other._value('_mean'), other._value('_M2'))
+
+        return self
+
+    def __iadd__(self, other):
+        return self.merge(other)
+
+    def __add__(self, other):
+        """Add two Welford objects.
+        """
+        return Welford(dtype=self.dtype, minmax=self.minmax).merge(self).merge(other)
+
     def max(self):
         """
         Max value for each element in array.
         """
+        self.flush()
         return self._max
 
     def min(self):
         """
         Min value for each element in array.
         """
+        self.flush()
         return self._min
 
     def mean(self, axis=None):
         """
         Compute the mean of accumulated data.
-           
+
         Parameters
         ----------
         axis: None or int or tuple of ints, optional
@@ -65,7 +324,7 @@ class Welford(object):
         if self.n == 0:
             return None
 
-        val = np.array(self._K + self._Ex / np.float64(self.n))
+        val = self._value('_mean')
         if axis:
             return val.mean(axis=axis)
         else:
@@ -83,8 +342,8 @@ class Welford(object):
         """
         if self.n <= 1:
             return  np.zeros(self.shape)
-            
-        val = np.array((self._Ex2 - (self._Ex*self._Ex)/np.float64(self.n)) / np.float64(self.n-1.))
+
+        val = self._value('_M2') / np.float64(self._n-1.)
 
         return val
 
@@ -100,12 +359,7 @@ class Welford(object):
         See Also:
             https://en.wikipedia.org/wiki/Standard_error
         """
-        return self.std()/sqrt(self.n)
-
-#    def __add__(self, val):
-#        """Add two Welford objects.
-#        """
-#
+        return self.std()/np.sqrt(self.n)
 
     def __str__(self):
         if self._init:
@@ -116,4 +370,3 @@ class Welford(object):
     def __repr__(self):
         return "< Welford: {:} >".format(str(self))
 
-
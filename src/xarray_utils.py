@@ -1,3 +1,23 @@
+def get_datetime64(sec, nsec):
+    """
+    Make datetime64[ns] times from arrays of seconds and nanoseconds.
+
+    Parameters
+    ----------
+    sec : array_like
+        Seconds since 1970 (e.g., the sec coordinate)
+    nsec : array_like
+        Nanoseconds (e.g., the nsec coordinate)
+
+    Returns
+    -------
+    numpy.ndarray of datetime64[ns]
+    """
+    import numpy as np
+    sec = np.asarray(getattr(sec, 'values', sec), dtype=np.int64)
+    nsec = np.asarray(getattr(nsec, 'values', nsec), dtype=np.int64)
+    return (sec*1000000000+nsec).astype('datetime64[ns]')
+
 def to_summary(x, dim='time', groupby='step', 
         save_summary=False,
         normby=None,
@@ -504,12 +524,117 @@ def ttest_groupby(xo, attr, groupby='ec162', ishot=0, nearest=None, verbose=Fals
             print '{:} has only one group -- cannot compare'.format(attr)
         return None
 
+def ttest_groupby_table(xo, attrs, groupby='ec162', ishots=[0], nearest=None):
+    """
+    Two sample t-test (see scipy.stats.ttest_ind) of groupby events (e.g., drop shots)
+    against the other events for many attributes and shot offsets at once.
+
+    Events are selected as in ttest_groupby for each attr and ishot.  Attributes
+    with the same missing events share the group indices and are tested together 
+    with array sums (prefix sums for the shifted non-drop events).
+
+    Parameters
+    ----------
+    attrs : list
+        Names of 1-D time variables to test
+    groupby : str
+        Boolean variable defining groups (e.g., 'ec162' for drop shots)
+    ishots : list
+        Shot offsets of groupby events
+    nearest : int
+        If not None compare with this number of events on either side 
+        of groupby events instead of all other events
+
+    Returns
+    -------
+    pandas.DataFrame of t_stat and t_pvalue indexed by attr and ishot.
+    Attributes with only one group are omitted.
+    """
+    import numpy as np
+    import pandas as pd
+    from scipy import stats
+    ishots = np.array(ishots, dtype=int)
+    xds = xo.reset_coords()
+    gvals = xds[groupby].values
+    
+    # Group attributes with the same missing events 
+    # (group indices are positions after dropna as in ttest_groupby)
+    masks = {}
+    for attr in attrs:
+        try:
+            ok = ~np.isnan(xds[attr].values.astype(np.float64))
+        except:
+            continue
+        key = ok.tobytes()
+        if key not in masks:
+            masks[key] = (ok, [])
+        masks[key][1].append(attr)
+
+    rows = []
+    for ok, gattrs in masks.values():
+        g = gvals[ok]
+        ntime = len(g)
+        if len(set(g[~pd.isnull(g)])) < 2:
+            continue
+
+        idrop = np.flatnonzero(g == 1)
+        V = np.array([xds[attr].values[ok] for attr in gattrs], dtype=np.float64)
+        # center for the sums of squares
+        V -= V.mean(axis=1)[:,None]
+
+        def sums(index):
+            """Number, sums and sums of squares of V for valid index (nshot, m).
+            """
+            valid = (index > 0) & (index < ntime)
+            vals = np.where(valid, V[:,np.where(valid, index, 0)], 0.)
+            return valid.sum(axis=-1), vals.sum(axis=-1), (vals*vals).sum(axis=-1)
+
+        n1, s1, q1 = sums(idrop[None,:]+ishots[:,None])
+        if nearest is not None:
+            inears = np.r_[-nearest:0, 1:nearest+1]
+            n0, s0, q0 = sums((idrop[None,:]+inears[:,None]).reshape(1,-1))
+        else:
+            # all shifted events less those of the events not in the 0 group
+            iexcl = np.flatnonzero(g != 0)
+            ne, se, qe = sums(iexcl[None,:]+ishots[:,None])
+            P = np.zeros((len(V), ntime+1))
+            P[:,1:] = V.cumsum(axis=1)
+            Q = np.zeros((len(V), ntime+1))
+            Q[:,1:] = (V*V).cumsum(axis=1)
+            lo = np.maximum(1, ishots)
+            hi = np.maximum(np.minimum(ntime, ntime+ishots), lo)
+            n0 = hi-lo-ne
+            s0 = P[:,hi]-P[:,lo]-se
+            q0 = Q[:,hi]-Q[:,lo]-qe
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            m1 = s1/n1
+            m0 = s0/n0
+            dof = n1+n0-2.
+            sp2 = (np.maximum(q1-s1*m1, 0.)+np.maximum(q0-s0*m0, 0.))/dof
+            t = (m1-m0)/np.sqrt(sp2*(1./n1+1./n0))
+            pvalue = 2*stats.t.sf(np.abs(t), dof*np.ones(t.shape))
+
+        for iattr, attr in enumerate(gattrs):
+            for ishot, tstat, tpvalue in zip(ishots, t[iattr], pvalue[iattr]):
+                rows.append((attr, ishot, tstat, tpvalue))
+
+    df = pd.DataFrame(rows, columns=['attr','ishot','t_stat','t_pvalue'])
+    return df.set_index(['attr','ishot'])
+
 def test_correlation(x, attr0, attr1='Gasdet_post_atten', cut=None, shift=None, dim='time'):
+    """
+    Pearson correlation (see scipy.stats.pearsonr) of attr0 shifted by shift events 
+    with attr1 for events passing cut.
+
+    Note the cut was previously never applied (it was tested in the selected 
+    attributes), so results with a cut differ from earlier versions.
+    """
     from scipy import stats
     import numpy as np
     xds = x[[attr0,attr1]]
-    if cut and cut in xds:
-        xds = xds.where(x[cut]).where(x[cut].shift(**{dim:-shift})).dropna(dim) 
+    if cut and cut in x:
+        xds = xds.where(x[cut]).where(x[cut].shift(**{dim:-(shift or 0)})).dropna(dim) 
 
     xds = xds.reset_coords()
     
@@ -521,6 +646,79 @@ def test_correlation(x, attr0, attr1='Gasdet_post_atten', cut=None, shift=None,
     result = stats.pearsonr(df0[kind],df1[kind])
     return result
 
+def test_correlation_table(x, attrs, attr1='Gasdet_post_atten', cut=None, shifts=[0], dim='time'):
+    """
+    Pearson correlation (see scipy.stats.pearsonr) of many attributes with attr1 
+    for each shift, as in test_correlation.
+
+    Attributes with the same missing and non-finite events are packed into one 
+    2-D array and correlated with attr1 for all shifts with matrix operations.
+
+    Returns
+    -------
+    pandas.DataFrame of beam_corr and c_pvalue indexed by attr and shift
+    """
+    import numpy as np
+    import pandas as pd
+    from scipy import stats
+    xds = x.reset_coords()
+    b = xds[attr1].values.astype(np.float64)
+    if cut and cut in xds:
+        acut = xds[cut].values.astype(bool)
+    else:
+        cut = None
+
+    # Group attributes with the same missing and non-finite events
+    groups = {}
+    for attr in attrs:
+        try:
+            a = xds[attr].values.astype(np.float64)
+        except:
+            continue
+        key = np.isnan(a).tobytes()+np.isinf(a).tobytes()
+        if key not in groups:
+            groups[key] = (a, [])
+        groups[key][1].append(attr)
+
+    rows = []
+    for a0, gattrs in groups.values():
+        A = np.array([xds[attr].values for attr in gattrs], dtype=np.float64)
+        for shift in shifts:
+            shift = int(shift or 0)
+            if cut:
+                # events dropped with where(cut) and where(cut.shift) before shifting attr  
+                cut_shift = np.ones(len(acut), dtype=bool)
+                if shift >= 0:
+                    cut_shift[:len(acut)-shift] = acut[shift:]
+                else:
+                    cut_shift[-shift:] = acut[:shift]
+                irows = np.flatnonzero(acut & cut_shift & ~np.isnan(a0) & ~np.isnan(b))
+            else:
+                irows = np.arange(len(b))
+            
+            nrows = len(irows)
+            j = np.arange(max(0, -shift), min(nrows, nrows-shift))
+            ia = irows[j+shift]
+            ib = irows[j]
+            valid = np.isfinite(a0[ia]) & np.isfinite(b[ib])
+            Ac = A[:,ia[valid]]
+            bc = b[ib[valid]]
+            n = len(bc)
+            Ac = Ac - Ac.mean(axis=1)[:,None]
+            bc = bc - bc.mean()
+            with np.errstate(divide='ignore', invalid='ignore'):
+                r = Ac.dot(bc)/np.sqrt((Ac*Ac).sum(axis=1)*bc.dot(bc))
+                r = np.clip(r, -1., 1.)
+                tstat = r*np.sqrt((n-2.)/(1.-r*r))
+                pvalue = 2*stats.t.sf(np.abs(tstat), n-2.)
+            pvalue[np.abs(r) == 1.] = 0.
+            
+            for attr, corr, pval in zip(gattrs, r, pvalue):
+                rows.append((attr, shift, corr, pval))
+
+    df = pd.DataFrame(rows, columns=['attr','shift','beam_corr','c_pvalue'])
+    return df.set_index(['attr','shift'])
+
 def set_delta_beam(x, code='ec162', attr='delta_drop'):
     """Find the number of beam codes to nearest code
        using time stamps
@@ -536,11 +734,17 @@ def set_delta_beam(x, code='ec162', attr='delta_drop'):
             if df0.any():
                 df_beam = x.reset_coords().fiducials.to_pandas()/3
                 df_drop = df_beam[df0]
-                x.coords[attr] = df_beam
-                i = 0
-                for a, b in df_beam.iteritems():
-                    x.coords[attr][i] = b-df_drop.values[np.argmin(abs(df_drop.index-a))]
-                    i += 1
+                # nearest drop shot in time for all events from the sorted drop times
+                tdrop = df_drop.index.values.astype(np.int64)
+                isort = np.argsort(tdrop, kind='mergesort')
+                tdrop = tdrop[isort]
+                vdrop = df_drop.values[isort]
+                tbeam = df_beam.index.values.astype(np.int64)
+                idx = np.searchsorted(tdrop, tbeam)
+                iright = np.minimum(idx, len(tdrop)-1)
+                ileft = np.maximum(idx-1, 0)
+                inearest = np.where(abs(tdrop[iright]-tbeam) < abs(tbeam-tdrop[ileft]), iright, ileft)
+                x.coords[attr] = df_beam - vdrop[inearest]
                 # Not robust way to get rid of outliers 
                 #dbeam_max = df_beam.diff().max()
                 #x.coords[attr][abs(x.coords[attr]) > dbeam_max] = dbeam_max
@@ -598,13 +802,37 @@ def find_beam_correlations(xo, pvalue=1e-20, pvalue0_ratio=0.1, corr_pvalue=0.00
     xo.attrs['drop_attr'] = groupby
 
     print('Analyzing beam correlations for {:} Run {:}'.format(xo.experiment, xo.run))
-    for attr in [a for a in xds.data_vars if xds[a].dims == ('time',)]:
-        adf = xds[attr].dropna(dim='time').to_pandas()
-        if len(adf) < 5:
+    # Need to rework ttest_groupby and test_correlation
+    # to handle non 120Hz data in a more natural way
+    # This fixes timing errors but not necessarily robustly
+    ashots = sorted([a for a in set(xo[corr_coord].values) if abs(a) <= nearest])
+    ishots = [iashot-ashots.index(0) for iashot in range(len(ashots))]
+    
+    # t-tests for all attributes and shots -- if FEEGasDetEnergy detector 
+    # then test against all other with shifted drops
+    tattrs = [a for a in xds.data_vars if xds[a].dims == ('time',)]
+    pulse_alias = xds[pulse].attrs.get('alias')
+    df_ttests = pd.concat([ttest_groupby_table(xds, 
+                            [a for a in tattrs if (xds[a].attrs.get('alias') == pulse_alias) == same], 
+                            groupby=groupby, ishots=ishots, nearest=None if same else nearest) 
+                           for same in [True, False]])
+    ttests = {key: tuple(vals) for key, vals in zip(df_ttests.index, df_ttests.values)}
+
+    if cut and cut not in xds:
+        print('Ommitting cut: {:} not valid cut'.format(cut))
+        cut = None
+    
+    # Pearson correlations with pulse for all attributes and shots 
+    df_ctests = test_correlation_table(xds, tattrs, pulse, cut=cut, shifts=ishots)
+    ctests = {key: tuple(vals) for key, vals in zip(df_ctests.index, df_ctests.values)}
+
+    for attr in tattrs:
+        avals = xds[attr].values
+        avals = avals[~pd.isnull(avals)]
+        if len(avals) < 5:
             print('Skipping {:} -- too few events'.format(attr))
             continue
-        adf_unique = adf.unique()
-        if len(adf_unique) < 2:
+        if len(pd.unique(avals)) < 2:
             print('Skipping {:} -- only one unique value in data'.format(attr))
             continue
 
@@ -612,11 +840,7 @@ def find_beam_correlations(xo, pvalue=1e-20, pvalue0_ratio=0.1, corr_pvalue=0.00
         print '*****', attr, '*******'
         attrs = [attr, groupby, pulse]
         if cut:
-            if cut in xds:
-                attrs.append(cut)
-            else:
-                print('Ommitting cut: {:} not valid cut'.format(cut))
-                cut = None
+            attrs.append(cut)
 
         # use lower threshold for area detector
         if attr in adets:
@@ -633,19 +857,8 @@ def find_beam_correlations(xo, pvalue=1e-20, pvalue0_ratio=0.1, corr_pvalue=0.00
 
         #ashots = range(-nearest,nearest+1)
         #for ishot in ashots:
-        # Need to rework ttest_groupby and test_correlation
-        # to handle non 120Hz data in a more natural way
-        # This fixes timing errors but not necessarily robustly
-        ashots = sorted([a for a in set(xo[corr_coord].values) if abs(a) <= nearest])
-        for iashot,idelta in enumerate(ashots):
-            ishot = iashot-ashots.index(0)
-            if x[pulse].attrs.get('alias') == x[attr].attrs.get('alias'):
-                # if FEEGasDetEnergy detector then test agains all other with shifted drops
-                tnearest = None 
-            else:
-                tnearest = nearest
-            ttest = ttest_groupby(x, attr, groupby=groupby, ishot=ishot, 
-                                    nearest=tnearest)
+        for ishot, idelta in zip(ishots, ashots):
+            ttest = ttests.get((attr, ishot))
             attest[idelta] = ttest
             if ttest is None:
                 if verbose:
@@ -653,7 +866,7 @@ def find_beam_correlations(xo, pvalue=1e-20, pvalue0_ratio=0.1, corr_pvalue=0.00
                 continue
          
             # Do not test correlation of same attr
-            ctest = test_correlation(x, attr, pulse, cut=cut, shift=ishot)
+            ctest = ctests.get((attr, ishot))
             actest[idelta] = ctest
 
         xstd = x[attr].groupby(groupby).std()
@@ -1128,7 +1341,7 @@ def open_cxi_dataset(file_name, load_peakpos=False, add_time=False, **kwargs):
         xdata.coords['nsec'] = xdata.machineTimeNanoSeconds
         xdata.coords['time_ns'] = np.int64(xdata.sec*1e9+xdata.nsec)
         if add_time:
-            xdata['time'] = [np.datetime64(int(sec*1e9+nsec), 'ns') for sec,nsec in zip(xdata.sec,xdata.nsec)]
+            xdata['time'] = get_datetime64(xdata.sec, xdata.nsec)
     except:
         print('Error making time from machintTime and machineTimeNanSeconds')
 
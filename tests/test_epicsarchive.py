@@ -0,0 +1,123 @@
+"""
+Tests of the EpicsArchive batched and cached retrieval against a local 
+stand-in for the archiver (no network access needed).
+"""
+import os
+import sys
+import shutil
+import tempfile
+import threading
+import unittest
+import urllib
+import urlparse
+import calendar
+import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+import epicsarchive
+
+
+class FakeArchiver(object):
+    """Stand-in for epicsarchive.url_query with hourly points for every PV.
+    PVs starting with 'NO' are not in the archive.
+    """
+    def __init__(self):
+        self.urls = []
+        self._lock = threading.Lock()
+        self.threads = set()
+
+    def __call__(self, url):
+        with self._lock:
+            self.urls.append(url)
+            self.threads.add(threading.current_thread().ident)
+        parts = urlparse.urlsplit(url)
+        query = urlparse.parse_qs(parts.query)
+        pv = query['pv'][0]
+        if parts.path.endswith('getAllPVs'):
+            if pv.startswith('NO'):
+                return []
+            return [pv]
+        
+        tstart = self._secs(query['from'][0])
+        tend = self._secs(query['to'][0])
+        data = [{'secs': t, 'nanos': 0, 'val': t} for t in range(tstart, tend+1, 3600)]
+        return [{'meta': {'name': pv}, 'data': data}]
+
+    @staticmethod
+    def _secs(date):
+        dt = datetime.datetime.strptime(urllib.unquote(date)[:19], '%Y-%m-%dT%H:%M:%S')
+        return calendar.timegm(dt.timetuple())
+
+    def data_urls(self, pv=None):
+        urls = [url for url in self.urls if 'getData' in url]
+        if pv:
+            urls = [url for url in urls if urllib.quote(pv, safe='') in url]
+        return urls
+
+
+class TestEpicsArchive(unittest.TestCase):
+
+    def setUp(self):
+        self.fake = FakeArchiver()
+        self._url_query = epicsarchive.url_query
+        epicsarchive.url_query = self.fake
+        self.cache_path = tempfile.mkdtemp()
+        self.arch = epicsarchive.EpicsArchive(cache_path=self.cache_path, nthreads=4)
+        self.pvs = ['XPP:MON:{:}'.format(i) for i in range(12)]
+
+    def tearDown(self):
+        epicsarchive.url_query = self._url_query
+        shutil.rmtree(self.cache_path)
+
+    def test_get_json_many(self):
+        vals = self.arch.get_json_many(self.pvs+self.pvs[:3], [2016,1,1], [2016,1,2])
+        self.assertEqual(sorted(vals), sorted(self.pvs))
+        for pv in self.pvs:
+            self.assertEqual(vals[pv][0]['meta']['name'], pv)
+            self.assertEqual(len(vals[pv][0]['data']), 25)
+        # each PV fetched once with requests spread over the threads
+        self.assertEqual(len(self.fake.data_urls()), len(self.pvs))
+        self.assertTrue(len(self.fake.threads) > 1)
+
+    def test_in_archive(self):
+        archived = self.arch.in_archive(self.pvs+['NO:PV'])
+        self.assertFalse(archived.pop('NO:PV'))
+        self.assertTrue(all(archived.values()))
+        # searches are only done once
+        self.arch.in_archive(self.pvs)
+        self.assertEqual(len(self.fake.urls), len(self.pvs)+1)
+
+    def test_cache_windows(self):
+        window1 = ([2016,1,1], [2016,1,2])
+        window2 = ([2016,3,1], [2016,3,3])
+        vals1 = self.arch.get_json_many(self.pvs, *window1)
+        vals2 = self.arch.get_json_many(self.pvs, *window2)
+        nfetch = len(self.fake.data_urls())
+        # both windows are cached
+        self.assertEqual(self.arch.get_json_many(self.pvs, *window1), vals1)
+        self.assertEqual(self.arch.get_json_many(self.pvs, *window2), vals2)
+        # a shorter window is sliced from the cache
+        vals = self.arch.get_json_many(self.pvs, [2016,1,1], [2016,1,1,12])
+        self.assertEqual(len(vals[self.pvs[0]][0]['data']), 13)
+        self.assertEqual(len(self.fake.data_urls()), nfetch)
+        # a new archive object uses the same cache on disk
+        arch = epicsarchive.EpicsArchive(cache_path=self.cache_path, nthreads=4)
+        self.assertEqual(arch.get_json_many(self.pvs, *window1), vals1)
+        self.assertEqual(len(self.fake.data_urls()), nfetch)
+
+    def test_cache_extend(self):
+        pv = self.pvs[0]
+        self.arch.get_json_many([pv], [2016,1,1], [2016,1,2])
+        vals = self.arch.get_json_many([pv], [2016,1,1], [2016,1,3])
+        urls = self.fake.data_urls(pv)
+        self.assertEqual(len(urls), 2)
+        # only the data after the cached end is fetched
+        self.assertTrue(epicsarchive.date_format(2016,1,2) in urls[1])
+        data = vals[pv][0]['data']
+        self.assertEqual(len(data), 49)
+        self.assertEqual([pt['secs'] for pt in data], sorted(set(pt['secs'] for pt in data)))
+
+
+if __name__ == '__main__':
+    unittest.main()